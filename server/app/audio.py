@@ -0,0 +1,255 @@
+import logging
+import mmap
+import os
+import struct
+import threading
+import traceback
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 浏览器端 createScriptProcessor(4096, 1, 1) 每帧发送的采样数
+FRAME_SIZE = 4096
+SAMPLE_RATE = 16000
+PCM16_SCALE = np.float32(1.0 / 32768.0)
+
+# numba为可选依赖，缺失时退回numpy实现。
+# 并行内核的线程池默认占满全部CPU核，与OMP_NUM_THREADS/CPU_THREADS一样按工作进程数平分；
+# set_num_threads只对调用线程生效，而转换会在to_thread的线程中执行，因此须在导入numba前设置
+os.environ.setdefault(
+    "NUMBA_NUM_THREADS", str(max(1, (os.cpu_count() or 1) // int(os.environ.get("WEB_CONCURRENCY", "1"))))
+)
+try:
+    from numba import njit, prange, types
+
+    _F32_OUT = types.float32[::1]
+    # np.frombuffer(bytes)得到只读数组，numpy运算结果为可写数组，两种都编译
+    _SIGNATURES = [
+        types.void(types.Array(types.int16, 1, "C", readonly=True), _F32_OUT),
+        types.void(types.int16[::1], _F32_OUT),
+    ]
+
+    @njit(_SIGNATURES, cache=True, fastmath=True)
+    def _pcm16_to_float32_frame(src, dst):
+        # 循环上界在编译期已知，LLVM可完全展开并向量化，无需处理尾部
+        for i in range(4096):
+            dst[i] = src[i] * PCM16_SCALE
+
+    @njit(_SIGNATURES, cache=True, fastmath=True)
+    def _pcm16_to_float32_any(src, dst):
+        for i in range(src.shape[0]):
+            dst[i] = src[i] * PCM16_SCALE
+
+    @njit(_SIGNATURES, cache=True, fastmath=True, parallel=True)
+    def _stereo_pcm16_to_float32(src, dst):
+        # 交错的立体声一次读入，下混与归一化在同一循环内完成
+        for i in prange(dst.shape[0]):
+            dst[i] = ((src[2 * i] >> 1) + (src[2 * i + 1] >> 1)) * PCM16_SCALE
+
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+
+class AudioBufferPool:
+    """
+    可复用的float32音频缓冲区池，避免每个请求都按整段音频重新分配数组
+
+    缓冲区从acquire到release期间由调用方独占；faster-whisper会在其他线程中
+    惰性读取音频，因此不能用threading.local按线程复用，必须等转录结束后显式归还
+    """
+
+    def __init__(self, max_buffers: int = 2, max_samples: int = SAMPLE_RATE * 60 * 10):
+        """
+        Args:
+            max_buffers: 池中最多保留的空闲缓冲区数量
+            max_samples: 单个缓冲区可被保留的最大采样数，超长音频用完即释放
+        """
+        self.max_buffers = max_buffers
+        self.max_samples = max_samples
+        self._free: List[np.ndarray] = []
+        self._lock = threading.Lock()
+
+    def acquire(self, size: int) -> np.ndarray:
+        """
+        取出一个至少容纳size个采样的缓冲区，返回长度恰为size的视图
+        """
+        with self._lock:
+            # 选能容纳的最小缓冲区，大缓冲区留给长音频
+            fits = [i for i, buf in enumerate(self._free) if buf.shape[0] >= size]
+            if fits:
+                index = min(fits, key=lambda i: self._free[i].shape[0])
+                return self._free.pop(index)[:size]
+        return np.empty(size, dtype=np.float32)
+
+    def release(self, array: np.ndarray):
+        """
+        归还acquire得到的视图，调用后不得再使用该数组
+        """
+        buf = array if array.base is None else array.base
+        if not isinstance(buf, np.ndarray) or buf.dtype != np.float32 or buf.shape[0] > self.max_samples:
+            return
+        with self._lock:
+            if any(free is buf for free in self._free):
+                return
+            self._free.append(buf)
+            if len(self._free) > self.max_buffers:
+                # 丢弃最小的，保留更可能被复用的大缓冲区
+                self._free.pop(min(range(len(self._free)), key=lambda i: self._free[i].shape[0]))
+
+
+def pcm16_to_float32(data: Union[bytes, np.ndarray], pool: Optional[AudioBufferPool] = None,
+                     out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    将16位PCM转换为[-1, 1)范围的float32数组
+
+    Args:
+        data: 小端16位PCM原始字节，或一维int16数组
+        pool: 输出缓冲区池，提供时结果写入池中缓冲区，用完需调用pool.release归还
+        out: 直接写入的连续float32数组，长度须等于采样数，优先于pool；不符时抛出ValueError
+
+    Returns:
+        float32音频数组
+    """
+    src = np.ascontiguousarray(data) if isinstance(data, np.ndarray) else np.frombuffer(data, dtype=np.int16)
+    if out is not None:
+        # numba内核不做越界检查，长度或类型不符会直接写坏内存
+        if out.dtype != np.float32 or out.shape[0] != src.shape[0]:
+            raise ValueError(f"out须为长度{src.shape[0]}的float32数组，实际为{out.dtype}[{out.shape[0]}]")
+        dst = out
+    else:
+        dst = pool.acquire(src.shape[0]) if pool is not None else np.empty(src.shape[0], dtype=np.float32)
+    if not HAS_NUMBA:
+        np.multiply(src, PCM16_SCALE, out=dst)
+    elif src.shape[0] == FRAME_SIZE:
+        _pcm16_to_float32_frame(src, dst)
+    else:
+        _pcm16_to_float32_any(src, dst)
+    return dst
+
+
+# WAVE_FORMAT_PCM 与 WAVE_FORMAT_EXTENSIBLE
+_WAVE_FORMAT_PCM = 0x0001
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+def _find_wav_pcm16_data(f) -> Optional[Tuple[int, int, int]]:
+    """
+    解析RIFF/WAVE头，定位16kHz、16位PCM的data块
+
+    Args:
+        f: 以二进制方式打开的文件对象
+
+    Returns:
+        (声道数, data块偏移, data块字节数)；格式不符时返回None
+    """
+    riff, _, wave_id = struct.unpack("<4sI4s", f.read(12))
+    if riff != b"RIFF" or wave_id != b"WAVE":
+        return None
+    channels = None
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        chunk_id, chunk_size = struct.unpack("<4sI", header)
+        if chunk_id == b"data":
+            return (channels, f.tell(), chunk_size) if channels else None
+        if chunk_id == b"fmt ":
+            fmt = f.read(chunk_size)
+            format_tag, nchannels, rate, _, _, bits = struct.unpack("<HHIIHH", fmt[:16])
+            if format_tag == _WAVE_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+                # 扩展格式的实际编码在SubFormat GUID的前两个字节
+                format_tag = struct.unpack("<H", fmt[24:26])[0]
+            if format_tag != _WAVE_FORMAT_PCM or rate != SAMPLE_RATE or bits != 16 or nchannels not in (1, 2):
+                return None
+            channels = nchannels
+            f.seek(chunk_size & 1, os.SEEK_CUR)
+        else:
+            # RIFF块按偶数字节对齐
+            f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+
+
+def _mapped_pcm16_to_float32(mm: mmap.mmap, offset: int, count: int, channels: int,
+                             pool: Optional[AudioBufferPool]) -> np.ndarray:
+    """
+    在内存映射上直接转换采样；映射的视图只在本函数内存活，返回后即可关闭映射
+    """
+    samples = np.frombuffer(mm, dtype=np.int16, count=count, offset=offset)
+    try:
+        if channels == 2:
+            return stereo_pcm16_to_float32(samples, pool)
+        return pcm16_to_float32(samples, pool)
+    except BaseException as e:
+        # 异常的traceback引用着各层调用帧，帧中的局部变量仍持有映射的视图，
+        # 关闭映射时会抛出BufferError掩盖原异常，因此先清空这些帧
+        traceback.clear_frames(e.__traceback__)
+        raise
+    finally:
+        del samples
+
+
+def stereo_pcm16_to_float32(data: Union[bytes, np.ndarray], pool: Optional[AudioBufferPool] = None) -> np.ndarray:
+    """
+    将交错的16位立体声PCM下混为单声道float32数组
+
+    Args:
+        data: 小端16位交错立体声PCM原始字节，或一维int16数组
+        pool: 输出缓冲区池，见pcm16_to_float32
+
+    Returns:
+        float32单声道音频数组
+    """
+    src = np.ascontiguousarray(data) if isinstance(data, np.ndarray) else np.frombuffer(data, dtype=np.int16)
+    if not HAS_NUMBA:
+        # 在int16上完成下混：各声道先右移一位再相加，不会溢出，也不产生float中间数组
+        pair = src[:src.shape[0] // 2 * 2].reshape(-1, 2)
+        return pcm16_to_float32((pair[:, 0] >> 1) + (pair[:, 1] >> 1), pool)
+    size = src.shape[0] // 2
+    dst = pool.acquire(size) if pool is not None else np.empty(size, dtype=np.float32)
+    _stereo_pcm16_to_float32(src, dst)
+    return dst
+
+
+def load_wav_pcm16(path: str, pool: Optional[AudioBufferPool] = None) -> Optional[np.ndarray]:
+    """
+    直接读取16kHz、16位PCM的单声道或立体声WAV文件，跳过通用解码与重采样
+
+    data块通过mmap映射后原地转换，不再把整段PCM读成一份bytes副本
+
+    Args:
+        path: WAV文件路径
+        pool: 输出缓冲区池，见pcm16_to_float32
+
+    Returns:
+        float32音频数组；文件不是该格式时返回None，由调用方走通用解码
+    """
+    with open(path, "rb") as f:
+        try:
+            layout = _find_wav_pcm16_data(f)
+        except struct.error:
+            return None
+        if layout is None:
+            return None
+        channels, data_offset, data_size = layout
+        # 管道输出的WAV可能把data大小写成占位值，以实际文件长度为准
+        data_size = min(data_size, os.fstat(f.fileno()).st_size - data_offset)
+        count = max(data_size, 0) // (2 * channels) * channels
+        if count == 0:
+            return pcm16_to_float32(b"", pool)
+        # mmap的偏移必须按分配粒度对齐
+        map_offset = data_offset - data_offset % mmap.ALLOCATIONGRANULARITY
+        with mmap.mmap(f.fileno(), data_offset + count * 2 - map_offset,
+                       offset=map_offset, access=mmap.ACCESS_READ) as mm:
+            return _mapped_pcm16_to_float32(mm, data_offset - map_offset, count, channels, pool)
+
+
+def warmup():
+    """
+    预热转换内核，避免首个音频帧承担JIT/缓存加载的延迟
+    """
+    pcm16_to_float32(bytes(FRAME_SIZE * 2))
+    pcm16_to_float32(bytes(2))
+    stereo_pcm16_to_float32(bytes(4))
+    logger.info(f"PCM转换内核预热完成 (numba={'启用' if HAS_NUMBA else '未启用'})")
@@ -2,14 +2,17 @@ import os
 import asyncio
 import logging
 import tempfile
+import time
+import numpy as np
 from typing import Optional, List, Dict, Any
 from enum import Enum
 from fastapi import APIRouter, UploadFile, File, Form, BackgroundTasks, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import FileResponse, JSONResponse
 from pydantic import BaseModel
 
-from stream_whisper.faster_whisper import FasterWhisperStream
+from stream_whisper.faster_whisper import DEFAULT_DEVICE, FasterWhisperStream, unload_whisper_model
 from audio_downloader import AudioDownloader
+from app.audio import SAMPLE_RATE, AudioBufferPool, load_wav_pcm16, pcm16_to_float32
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -22,8 +25,58 @@ router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
-# 初始化转录器
-transcriber = FasterWhisperStream(output_path="subtitles",device="cuda",compute_type="float16")
+class LazyTranscriber:
+    """
+    首个转录请求到来时才加载模型，不阻塞服务启动；
+    设置TRANSCRIBER_IDLE_TIMEOUT（秒）后，空闲超时即卸载模型，释放显存给同一GPU上的其他任务
+    """
+
+    def __init__(self, idle_timeout: float = 0):
+        self.idle_timeout = idle_timeout
+        self._transcriber: Optional[FasterWhisperStream] = None
+        self._lock = asyncio.Lock()
+        self._active = 0
+        self._last_used = 0.0
+        self._unload_task: Optional[asyncio.Task] = None
+
+    async def acquire(self) -> FasterWhisperStream:
+        """
+        取得转录器，必要时加载模型；用完后必须调用release
+        """
+        async with self._lock:
+            if self._transcriber is None:
+                self._transcriber = await asyncio.to_thread(
+                    FasterWhisperStream, output_path="subtitles"
+                )
+                if self.idle_timeout > 0:
+                    self._unload_task = asyncio.create_task(self._unload_when_idle())
+            self._active += 1
+            return self._transcriber
+
+    @property
+    def current(self) -> Optional[FasterWhisperStream]:
+        """
+        已加载的转录器，尚未加载或已卸载时为None
+        """
+        return self._transcriber
+
+    def release(self):
+        self._active -= 1
+        self._last_used = time.monotonic()
+
+    async def _unload_when_idle(self):
+        while True:
+            await asyncio.sleep(self.idle_timeout / 2)
+            async with self._lock:
+                if self._active == 0 and time.monotonic() - self._last_used >= self.idle_timeout:
+                    logger.info(f"转录器空闲超过 {self.idle_timeout:.0f} 秒，卸载模型")
+                    unload_whisper_model(self._transcriber.model)
+                    self._transcriber = None
+                    self._unload_task = None
+                    return
+
+# 初始化转录器（延迟加载）
+transcriber = LazyTranscriber(idle_timeout=float(os.environ.get("TRANSCRIBER_IDLE_TIMEOUT", "0")))
 
 output_path = "temp"
 subtitles_path = "subtitles"
@@ -32,6 +85,66 @@ quality = "0"
 
 ytdlp_downloader = AudioDownloader(output_path, audio_format, quality)
 
+# 允许下载的字幕格式
+SUBTITLE_FORMATS = frozenset({"srt", "vtt", "json"})
+
+# 解码后音频的缓冲区池，连续的请求复用同一块内存
+audio_pool = AudioBufferPool()
+
+async def decode_upload_audio(file: UploadFile, chunk_size: int = 1 << 20) -> np.ndarray:
+    """
+    将上传文件边接收边送入ffmpeg解码，直接得到16kHz单声道float32音频，
+    不在内存中保留完整视频，也不落盘临时文件
+
+    注意：输入来自管道，无法seek，moov位于文件末尾的MP4需先做faststart处理
+    """
+    proc = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-nostats", "-threads", "0",
+        "-i", "pipe:0", "-vn", "-ac", "1", "-ar", "16000",
+        "-f", "s16le", "-acodec", "pcm_s16le", "pipe:1",
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+
+    async def feed():
+        try:
+            while chunk := await file.read(chunk_size):
+                proc.stdin.write(chunk)
+                await proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # ffmpeg提前退出，错误信息由stderr给出
+            pass
+        finally:
+            proc.stdin.close()
+
+    async def collect() -> np.ndarray:
+        # ffmpeg输出边读边转换为float32写入池中的缓冲区，不再拼接出完整的PCM bytes
+        audio = audio_pool.acquire(SAMPLE_RATE * 60)
+        size = 0
+        pending = b""
+        while chunk := await proc.stdout.read(chunk_size):
+            if pending:
+                chunk = pending + chunk
+            # 16位采样可能被分块截断，剩余的奇数字节留到下一块
+            usable = len(chunk) & ~1
+            pending = chunk[usable:]
+            count = usable // 2
+            if size + count > audio.shape[0]:
+                grown = audio_pool.acquire(max(size + count, audio.shape[0] * 2))
+                grown[:size] = audio[:size]
+                audio_pool.release(audio)
+                audio = grown
+            pcm16_to_float32(np.frombuffer(chunk, dtype=np.int16, count=count), out=audio[size:size + count])
+            size += count
+        return audio[:size]
+
+    _, audio, stderr = await asyncio.gather(feed(), collect(), proc.stderr.read())
+    if await proc.wait() != 0:
+        audio_pool.release(audio)
+        raise RuntimeError(f"ffmpeg解码失败: {stderr.decode(errors='ignore').strip()}")
+    return audio
+
 @router.post("/transcribe")
 async def transcribe_for_browser_extension(
     background_tasks: BackgroundTasks,
@@ -54,25 +167,48 @@ async def transcribe_for_browser_extension(
     Returns:
         转录结果
     """
+    audio = None
+    reserved_path = None
+    transcribed = False
     try:
         if file:
-            # 添加清理任务
-            background_tasks.add_task(os.unlink, temp_path)
+            logger.info(f"接收到浏览器扩展转录请求: 文件={file.filename}, language={language}, task={task}")
+            audio = await decode_upload_audio(file)
+            # 原子地预留字幕文件名，不使用客户端提供的文件名
+            os.makedirs(subtitles_path, exist_ok=True)
+            fd, reserved_path = tempfile.mkstemp(dir=subtitles_path, suffix=".vtt")
+            os.close(fd)
+            file_name = os.path.splitext(os.path.basename(reserved_path))[0]
         elif file_uuid:
             logger.info(f"接收到浏览器扩展转录请求: UUID={file_uuid}, language={language}, task={task}")
+            if os.path.basename(file_uuid) != file_uuid:
+                raise HTTPException(status_code=400, detail=f"非法的文件UUID: {file_uuid}")
             # 根据UUID查找文件
-            temp_path = os.path.join(output_path, f"{file_uuid}.{audio_format}")
-            if not os.path.exists(temp_path):
+            audio_path = os.path.join(output_path, f"{file_uuid}.{audio_format}")
+            # 已是16kHz单声道PCM的WAV直接读取，其他格式交给faster-whisper解码；
+            # 直接打开文件，由打开失败判断文件不存在，不再单独stat一次
+            try:
+                audio = await asyncio.to_thread(load_wav_pcm16, audio_path, audio_pool)
+            except FileNotFoundError:
                 raise HTTPException(status_code=404, detail=f"找不到文件: {file_uuid}")
+            if audio is None:
+                audio = audio_path
+            file_name = file_uuid
         else:
             raise HTTPException(status_code=400, detail="必须提供文件或文件UUID")
         
         # 转录文件 - 注意这里不传递subtitle_format参数
-        segments_vtt = await transcriber.transcribe_file(
-            temp_path,
-            language=language,
-            task=task
-        )
+        whisper = await transcriber.acquire()
+        try:
+            segments_vtt = await whisper.transcribe_file(
+                audio,
+                language=language,
+                task=task,
+                file_name=file_name
+            )
+        finally:
+            transcriber.release()
+        transcribed = True
 
         subtitle_file = os.path.join(subtitles_path, segments_vtt)
         
@@ -85,9 +221,21 @@ async def transcribe_for_browser_extension(
             
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"浏览器扩展转录失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"转录失败: {str(e)}")
+    finally:
+        # 转录未完成（出错、请求被取消等）时删除预留的字幕文件
+        if reserved_path is not None and not transcribed:
+            try:
+                os.remove(reserved_path)
+            except FileNotFoundError:
+                pass
+        # 转录已消费完全部片段，缓冲区可以归还复用
+        if isinstance(audio, np.ndarray):
+            audio_pool.release(audio)
 
 @router.get("/status")
 async def get_extension_status():
@@ -99,11 +247,22 @@ async def get_extension_status():
     """
     try:
         # 获取模型信息
-        model_info = {
-            "model_size": os.environ.get("MODEL_SIZE", "base"),
-            "device": os.environ.get("DEVICE", "cpu"),
-            "compute_type": os.environ.get("COMPUTE_TYPE", "int8")
-        }
+        whisper = transcriber.current
+        if whisper is not None:
+            # 报告实际生效的配置（compute_type已按设备能力解析）
+            model_info = {
+                "model_size": whisper.model_size,
+                "device": whisper.device,
+                "compute_type": whisper.compute_type,
+                "loaded": True
+            }
+        else:
+            model_info = {
+                "model_size": os.environ.get("MODEL_SIZE", "base"),
+                "device": os.environ.get("DEVICE", DEFAULT_DEVICE),
+                "compute_type": os.environ.get("COMPUTE_TYPE", "auto"),
+                "loaded": False
+            }
         
         return {
             "status": "healthy",
@@ -133,7 +292,7 @@ async def get_subtitles(
     """
     try:
         # 验证格式是否合法
-        if format.lower() not in ["srt", "vtt", "json"]:
+        if format.lower() not in SUBTITLE_FORMATS:
             raise HTTPException(status_code=400, detail=f"不支持的字幕格式: {format}")
             
         file_path = os.path.join(subtitles_path, f"{file_uuid}.{format}")
@@ -142,7 +301,6 @@ async def get_subtitles(
             
         # 设置文件名，让浏览器正确处理下载
         filename = f"subtitle_{file_uuid}.{format}"
-        from fastapi.responses import FileResponse
         return FileResponse(
             path=file_path, 
             filename=filename,
@@ -162,7 +320,8 @@ async def extract_audio_from_url(
     logger.info(f"收到音频提取请求: {url}, video_id: {video_id}")
     
     try:
-        audio_filepath = ytdlp_downloader.download_audio(url)
+        # yt-dlp下载及ffmpeg转码是阻塞调用，放到线程中执行以免卡住事件循环
+        audio_filepath = await asyncio.to_thread(ytdlp_downloader.download_audio, url)
        
         return {
             "success": True,
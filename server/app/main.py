@@ -4,25 +4,35 @@ import logging
 import time
 import uuid
 import json
-import uvicorn
 from typing import List, Dict, Any, Optional
 from contextlib import asynccontextmanager
 
 import numpy as np
+import orjson
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, UploadFile, File, Form, BackgroundTasks, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse
+from fastapi.responses import HTMLResponse, JSONResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from app.browser_extension import router as browser_extension_router
+from app.audio import pcm16_to_float32, warmup as warmup_audio_kernels
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# 存储活跃的WebSocket连接
-active_connections: Dict[str, WebSocket] = {}
-# 存储流式转录器实例
-streaming_transcribers: Dict[str, Any] = {}
+# 流式转录依赖只在启动时导入一次，缺失时在连接阶段返回友好的错误
+try:
+    from streaming_sensevoice import StreamingSenseVoice
+    from pysilero import VADIterator
+    STREAMING_IMPORT_ERROR: Optional[str] = None
+except ImportError as e:
+    STREAMING_IMPORT_ERROR = str(e)
+
+async def send_json(websocket: WebSocket, data: Any):
+    """
+    使用orjson序列化并以文本帧发送JSON消息（客户端按字符串解析）
+    """
+    await websocket.send_text(orjson.dumps(data).decode())
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -30,6 +40,8 @@ async def lifespan(app: FastAPI):
     logger.info("Starting up Whisper Web API")
     # 确保临时目录存在
     os.makedirs("temp", exist_ok=True)
+    # 预热PCM转换内核
+    warmup_audio_kernels()
     
     yield
     
@@ -46,7 +58,8 @@ app = FastAPI(
     title="Whisper Web API",
     description="API for transcribing audio/video using faster-whisper",
     version="0.1.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # 配置CORS
@@ -70,276 +83,388 @@ app.include_router(browser_extension_router)
 async def root():
     return {"message": "Welcome to Whisper Web API"}
 
-@app.get("/test", response_class=HTMLResponse)
-async def test_page():
-    """
-    提供一个简单的测试页面，用于测试字幕功能
-    """
-    html_content = """
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Whisper Web 测试页面</title>
-        <style>
-            body {
-                font-family: Arial, sans-serif;
-                max-width: 800px;
-                margin: 0 auto;
-                padding: 20px;
-            }
-            h1 {
-                color: #333;
-            }
-            .container {
-                margin-top: 20px;
-            }
-            button {
-                padding: 10px 15px;
-                background-color: #4CAF50;
-                color: white;
-                border: none;
-                border-radius: 4px;
-                cursor: pointer;
-                margin-right: 10px;
-            }
-            button:hover {
-                background-color: #45a049;
-            }
-            button:disabled {
-                background-color: #cccccc;
-                cursor: not-allowed;
-            }
-            #status {
-                margin-top: 20px;
-                padding: 10px;
-                border-radius: 4px;
-            }
-            .success {
-                background-color: #d4edda;
-                color: #155724;
-            }
-            .error {
-                background-color: #f8d7da;
-                color: #721c24;
-            }
-            .info {
-                background-color: #d1ecf1;
-                color: #0c5460;
+# 测试页面HTML，在模块加载时构建一次
+_TEST_HTML = """
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Whisper Web 测试页面</title>
+    <style>
+        body {
+            font-family: Arial, sans-serif;
+            max-width: 800px;
+            margin: 0 auto;
+            padding: 20px;
+        }
+        h1 {
+            color: #333;
+        }
+        .container {
+            margin-top: 20px;
+        }
+        button {
+            padding: 10px 15px;
+            background-color: #4CAF50;
+            color: white;
+            border: none;
+            border-radius: 4px;
+            cursor: pointer;
+            margin-right: 10px;
+        }
+        button:hover {
+            background-color: #45a049;
+        }
+        button:disabled {
+            background-color: #cccccc;
+            cursor: not-allowed;
+        }
+        #status {
+            margin-top: 20px;
+            padding: 10px;
+            border-radius: 4px;
+        }
+        .success {
+            background-color: #d4edda;
+            color: #155724;
+        }
+        .error {
+            background-color: #f8d7da;
+            color: #721c24;
+        }
+        .info {
+            background-color: #d1ecf1;
+            color: #0c5460;
+        }
+        #subtitles {
+            margin-top: 20px;
+            padding: 15px;
+            background-color: #333;
+            color: white;
+            border-radius: 4px;
+            min-height: 50px;
+            text-align: center;
+            font-size: 18px;
+        }
+    </style>
+</head>
+<body>
+    <h1>Whisper Web 测试页面</h1>
+    <p>使用此页面测试Whisper Web API的流式字幕功能</p>
+
+    <div class="container">
+        <button id="startBtn">开始录音</button>
+        <button id="stopBtn" disabled>停止录音</button>
+    </div>
+
+    <div id="status" class="info">准备就绪</div>
+
+    <div id="subtitles">字幕将在这里显示</div>
+
+    <script>
+        const startBtn = document.getElementById('startBtn');
+        const stopBtn = document.getElementById('stopBtn');
+        const status = document.getElementById('status');
+        const subtitles = document.getElementById('subtitles');
+
+        let websocket = null;
+        let mediaRecorder = null;
+        let audioContext = null;
+        let audioStream = null;
+
+        // 更新状态
+        function updateStatus(message, type) {
+            status.textContent = message;
+            status.className = type;
+        }
+
+        // 更新字幕
+        function updateSubtitles(text) {
+            subtitles.textContent = text || '字幕将在这里显示';
+        }
+
+        // 连接WebSocket
+        function connectWebSocket() {
+            const clientId = 'test_' + Date.now();
+            const wsUrl = `ws://${window.location.host}/ws/stream/${clientId}`;
+
+            updateStatus('正在连接服务器...', 'info');
+
+            websocket = new WebSocket(wsUrl);
+            websocket.binaryType = 'arraybuffer';
+
+            websocket.onopen = () => {
+                updateStatus('已连接到服务器', 'success');
+                startRecording();
+            };
+
+            websocket.onmessage = (event) => {
+                try {
+                    const data = JSON.parse(event.data);
+
+                    if (data.type === 'streaming_result') {
+                        updateSubtitles(data.text);
+                    } else if (data.type === 'error') {
+                        updateStatus(`错误: ${data.message}`, 'error');
+                    } else if (data.type === 'info') {
+                        updateStatus(data.message, 'info');
+                    }
+                } catch (error) {
+                    console.error('解析消息时出错:', error);
+                }
+            };
+
+            websocket.onclose = () => {
+                updateStatus('连接已关闭', 'info');
+                stopRecording(false);
+            };
+
+            websocket.onerror = (error) => {
+                updateStatus('连接错误', 'error');
+                console.error('WebSocket错误:', error);
+                stopRecording(false);
+            };
+        }
+
+        // 开始录音
+        async function startRecording() {
+            try {
+                updateStatus('请求麦克风权限...', 'info');
+
+                // 获取音频流
+                audioStream = await navigator.mediaDevices.getUserMedia({ 
+                    audio: {
+                        echoCancellation: true,
+                        noiseSuppression: true,
+                        autoGainControl: true
+                    } 
+                });
+
+                // 创建音频上下文
+                audioContext = new (window.AudioContext || window.webkitAudioContext)({
+                    sampleRate: 16000
+                });
+                const source = audioContext.createMediaStreamSource(audioStream);
+
+                // 创建处理节点
+                const processor = audioContext.createScriptProcessor(4096, 1, 1);
+
+                // 连接节点
+                source.connect(processor);
+                processor.connect(audioContext.destination);
+
+                // 处理音频数据
+                processor.onaudioprocess = (e) => {
+                    if (!websocket || websocket.readyState !== WebSocket.OPEN) return;
+
+                    // 获取音频数据
+                    const inputData = e.inputBuffer.getChannelData(0);
+
+                    // 转换为16位整数
+                    const pcmData = new Int16Array(inputData.length);
+                    for (let i = 0; i < inputData.length; i++) {
+                        pcmData[i] = Math.max(-1, Math.min(1, inputData[i])) * 0x7FFF;
+                    }
+
+                    // 发送音频数据
+                    websocket.send(pcmData.buffer);
+                };
+
+                updateStatus('正在录音...', 'success');
+                startBtn.disabled = true;
+                stopBtn.disabled = false;
+
+            } catch (error) {
+                updateStatus(`录音错误: ${error.message}`, 'error');
+                console.error('启动录音时出错:', error);
             }
-            #subtitles {
-                margin-top: 20px;
-                padding: 15px;
-                background-color: #333;
-                color: white;
-                border-radius: 4px;
-                min-height: 50px;
-                text-align: center;
-                font-size: 18px;
+        }
+
+        // 停止录音
+        function stopRecording(sendEndSignal = true) {
+            // 停止音频流
+            if (audioStream) {
+                audioStream.getTracks().forEach(track => track.stop());
+                audioStream = null;
             }
-        </style>
-    </head>
-    <body>
-        <h1>Whisper Web 测试页面</h1>
-        <p>使用此页面测试Whisper Web API的流式字幕功能</p>
-        
-        <div class="container">
-            <button id="startBtn">开始录音</button>
-            <button id="stopBtn" disabled>停止录音</button>
-        </div>
-        
-        <div id="status" class="info">准备就绪</div>
-        
-        <div id="subtitles">字幕将在这里显示</div>
-        
-        <script>
-            const startBtn = document.getElementById('startBtn');
-            const stopBtn = document.getElementById('stopBtn');
-            const status = document.getElementById('status');
-            const subtitles = document.getElementById('subtitles');
-            
-            let websocket = null;
-            let mediaRecorder = null;
-            let audioContext = null;
-            let audioStream = null;
-            
-            // 更新状态
-            function updateStatus(message, type) {
-                status.textContent = message;
-                status.className = type;
+
+            // 关闭音频上下文
+            if (audioContext) {
+                audioContext.close().catch(console.error);
+                audioContext = null;
             }
-            
-            // 更新字幕
-            function updateSubtitles(text) {
-                subtitles.textContent = text || '字幕将在这里显示';
+
+            // 发送结束信号
+            if (websocket && websocket.readyState === WebSocket.OPEN && sendEndSignal) {
+                websocket.send('END_OF_AUDIO');
+                updateStatus('已停止录音，正在处理...', 'info');
             }
-            
-            // 连接WebSocket
-            function connectWebSocket() {
-                const clientId = 'test_' + Date.now();
-                const wsUrl = `ws://${window.location.host}/ws/stream/${clientId}`;
-                
-                updateStatus('正在连接服务器...', 'info');
-                
-                websocket = new WebSocket(wsUrl);
-                websocket.binaryType = 'arraybuffer';
-                
-                websocket.onopen = () => {
-                    updateStatus('已连接到服务器', 'success');
-                    startRecording();
-                };
-                
-                websocket.onmessage = (event) => {
-                    try {
-                        const data = JSON.parse(event.data);
-                        
-                        if (data.type === 'streaming_result') {
-                            updateSubtitles(data.text);
-                        } else if (data.type === 'error') {
-                            updateStatus(`错误: ${data.message}`, 'error');
-                        } else if (data.type === 'info') {
-                            updateStatus(data.message, 'info');
-                        }
-                    } catch (error) {
-                        console.error('解析消息时出错:', error);
+
+            // 关闭WebSocket
+            if (websocket) {
+                setTimeout(() => {
+                    if (websocket.readyState === WebSocket.OPEN) {
+                        websocket.close();
                     }
-                };
-                
-                websocket.onclose = () => {
-                    updateStatus('连接已关闭', 'info');
-                    stopRecording(false);
-                };
-                
-                websocket.onerror = (error) => {
-                    updateStatus('连接错误', 'error');
-                    console.error('WebSocket错误:', error);
-                    stopRecording(false);
-                };
+                    websocket = null;
+                }, 1000);
             }
-            
-            // 开始录音
-            async function startRecording() {
-                try {
-                    updateStatus('请求麦克风权限...', 'info');
-                    
-                    // 获取音频流
-                    audioStream = await navigator.mediaDevices.getUserMedia({ 
-                        audio: {
-                            echoCancellation: true,
-                            noiseSuppression: true,
-                            autoGainControl: true
-                        } 
-                    });
-                    
-                    // 创建音频上下文
-                    audioContext = new (window.AudioContext || window.webkitAudioContext)({
-                        sampleRate: 16000
-                    });
-                    const source = audioContext.createMediaStreamSource(audioStream);
-                    
-                    // 创建处理节点
-                    const processor = audioContext.createScriptProcessor(4096, 1, 1);
-                    
-                    // 连接节点
-                    source.connect(processor);
-                    processor.connect(audioContext.destination);
-                    
-                    // 处理音频数据
-                    processor.onaudioprocess = (e) => {
-                        if (!websocket || websocket.readyState !== WebSocket.OPEN) return;
-                        
-                        // 获取音频数据
-                        const inputData = e.inputBuffer.getChannelData(0);
-                        
-                        // 转换为16位整数
-                        const pcmData = new Int16Array(inputData.length);
-                        for (let i = 0; i < inputData.length; i++) {
-                            pcmData[i] = Math.max(-1, Math.min(1, inputData[i])) * 0x7FFF;
-                        }
-                        
-                        // 发送音频数据
-                        websocket.send(pcmData.buffer);
-                    };
-                    
-                    updateStatus('正在录音...', 'success');
-                    startBtn.disabled = true;
-                    stopBtn.disabled = false;
-                    
-                } catch (error) {
-                    updateStatus(`录音错误: ${error.message}`, 'error');
-                    console.error('启动录音时出错:', error);
-                }
-            }
-            
-            // 停止录音
-            function stopRecording(sendEndSignal = true) {
-                // 停止音频流
-                if (audioStream) {
-                    audioStream.getTracks().forEach(track => track.stop());
-                    audioStream = null;
-                }
-                
-                // 关闭音频上下文
-                if (audioContext) {
-                    audioContext.close().catch(console.error);
-                    audioContext = null;
-                }
-                
-                // 发送结束信号
-                if (websocket && websocket.readyState === WebSocket.OPEN && sendEndSignal) {
-                    websocket.send('END_OF_AUDIO');
-                    updateStatus('已停止录音，正在处理...', 'info');
-                }
-                
-                // 关闭WebSocket
-                if (websocket) {
-                    setTimeout(() => {
-                        if (websocket.readyState === WebSocket.OPEN) {
-                            websocket.close();
-                        }
-                        websocket = null;
-                    }, 1000);
-                }
-                
-                startBtn.disabled = false;
-                stopBtn.disabled = true;
-            }
-            
-            // 事件监听
-            startBtn.addEventListener('click', () => {
-                connectWebSocket();
-            });
-            
-            stopBtn.addEventListener('click', () => {
-                stopRecording();
-                updateStatus('录音已停止', 'info');
-            });
-        </script>
-    </body>
-    </html>
+
+            startBtn.disabled = false;
+            stopBtn.disabled = true;
+        }
+
+        // 事件监听
+        startBtn.addEventListener('click', () => {
+            connectWebSocket();
+        });
+
+        stopBtn.addEventListener('click', () => {
+            stopRecording();
+            updateStatus('录音已停止', 'info');
+        });
+    </script>
+</body>
+</html>
+"""
+
+@app.get("/test", response_class=HTMLResponse)
+async def test_page():
+    """
+    提供一个简单的测试页面，用于测试字幕功能
     """
-    return html_content
+    return HTMLResponse(content=_TEST_HTML)
 
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "timestamp": time.time()}
 
+def run_streaming_inference(model, vad_iterator, audio_samples: np.ndarray) -> List[str]:
+    """
+    在工作线程中执行VAD与流式推理，并在同一线程内完成结果序列化，
+    返回可直接发送的JSON文本，避免阻塞事件循环
+    """
+    messages = []
+    for speech_dict, speech_samples in vad_iterator(audio_samples):
+        if "start" in speech_dict:
+            logger.debug(f"检测到语音开始")
+            model.reset()
+        is_last = "end" in speech_dict
+        if is_last:
+            logger.debug(f"检测到语音结束")
+        
+        try:
+            for res in model.streaming_inference(speech_samples * 32768, is_last):
+                messages.append(orjson.dumps({
+                    "type": "streaming_result",
+                    "timestamps": res["timestamps"],
+                    "text": res["text"]
+                }).decode())
+        except Exception as e:
+            logger.error(f"流式转录时出错: {str(e)}")
+            messages.append(orjson.dumps({
+                "type": "error",
+                "message": f"转录失败: {str(e)}"
+            }).decode())
+    return messages
+
+class StreamingSession:
+    """
+    单个WebSocket连接的流式转录状态
+    """
+    
+    def __init__(self, websocket: WebSocket, client_id: str, model, vad_iterator):
+        self.websocket = websocket
+        self.client_id = client_id
+        self.model = model
+        self.vad_iterator = vad_iterator
+        self.audio_buffer: List[np.ndarray] = []
+
+async def handle_end_of_audio(session: StreamingSession, data: Optional[Dict[str, Any]]) -> bool:
+    """
+    处理END_OF_AUDIO信号：转录剩余音频并发送最终结果标记，返回True表示结束连接
+    """
+    logger.info(f"客户端 {session.client_id} 发送了END_OF_AUDIO信号")
+    # 处理剩余的音频数据
+    if session.audio_buffer:
+        try:
+            audio_samples = np.concatenate(session.audio_buffer)
+            for text in await asyncio.to_thread(run_streaming_inference, session.model, session.vad_iterator, audio_samples):
+                await session.websocket.send_text(text)
+        except Exception as e:
+            logger.error(f"处理最终音频数据时出错: {str(e)}")
+            await send_json(session.websocket, {
+                "type": "error",
+                "message": f"处理音频失败: {str(e)}"
+            })
+    
+    # 发送最终结果标记
+    await send_json(session.websocket, {
+        "type": "final_result"
+    })
+    logger.info(f"客户端 {session.client_id} 的转录已完成")
+    return True
+
+async def handle_reset(session: StreamingSession, data: Optional[Dict[str, Any]]) -> bool:
+    """
+    处理RESET信号：重置模型和VAD
+    """
+    logger.info(f"客户端 {session.client_id} 请求重置")
+    try:
+        session.model.reset()
+        # 复用已有的VAD实例，仅重置内部状态
+        session.vad_iterator.reset()
+        session.audio_buffer.clear()
+        await send_json(session.websocket, {
+            "type": "reset_complete"
+        })
+        logger.info(f"客户端 {session.client_id} 重置完成")
+    except Exception as e:
+        logger.error(f"重置转录器时出错: {str(e)}")
+        await send_json(session.websocket, {
+            "type": "error",
+            "message": f"重置失败: {str(e)}"
+        })
+    return False
+
+async def handle_test(session: StreamingSession, data: Optional[Dict[str, Any]]) -> bool:
+    await send_json(session.websocket, {
+        "type": "test_response",
+        "message": "服务器已收到测试消息"
+    })
+    return False
+
+async def handle_heartbeat(session: StreamingSession, data: Optional[Dict[str, Any]]) -> bool:
+    await send_json(session.websocket, {
+        "type": "heartbeat_response",
+        "message": "pong"
+    })
+    return False
+
+# 纯文本控制命令，直接按字符串匹配，无需解析JSON
+TEXT_COMMAND_HANDLERS = {
+    "END_OF_AUDIO": handle_end_of_audio,
+    "RESET": handle_reset,
+}
+
+# JSON控制消息，按type字段分发
+JSON_MESSAGE_HANDLERS = {
+    "test": handle_test,
+    "heartbeat": handle_heartbeat,
+}
+
 @app.websocket("/ws/stream/{client_id}")
 async def websocket_stream(websocket: WebSocket, client_id: str):
     """
     WebSocket端点，用于实时流式音频转录，提供实时字幕
     """
-    try:
-        from streaming_sensevoice import StreamingSenseVoice
-        from pysilero import VADIterator
-        import numpy as np
-    except ImportError as e:
-        logger.error(f"导入流式转录模块时出错: {str(e)}")
+    if STREAMING_IMPORT_ERROR is not None:
+        logger.error(f"导入流式转录模块时出错: {STREAMING_IMPORT_ERROR}")
         await websocket.accept()
-        await websocket.send_json({
+        await send_json(websocket, {
             "type": "error",
-            "message": f"服务器缺少必要的模块: {str(e)}"
+            "message": f"服务器缺少必要的模块: {STREAMING_IMPORT_ERROR}"
         })
-        await websocket.close(code=1011, reason=f"服务器缺少必要的模块: {str(e)}")
+        await websocket.close(code=1011, reason=f"服务器缺少必要的模块: {STREAMING_IMPORT_ERROR}")
         return
     
     logger.info(f"客户端 {client_id} 请求流式转录连接")
@@ -347,7 +472,7 @@ async def websocket_stream(websocket: WebSocket, client_id: str):
     logger.info(f"已接受客户端 {client_id} 的WebSocket连接")
     
     # 发送连接成功消息
-    await websocket.send_json({
+    await send_json(websocket, {
         "type": "info",
         "message": "连接成功，等待音频数据"
     })
@@ -355,28 +480,20 @@ async def websocket_stream(websocket: WebSocket, client_id: str):
     # 初始化流式转录器
     try:
         logger.info(f"为客户端 {client_id} 初始化流式转录器")
-        model = StreamingSenseVoice()
+        model = await asyncio.to_thread(StreamingSenseVoice)
         vad_iterator = VADIterator(speech_pad_ms=300)
-        streaming_transcribers[client_id] = {
-            "model": model,
-            "vad_iterator": vad_iterator
-        }
+        session = StreamingSession(websocket, client_id, model, vad_iterator)
         logger.info(f"客户端 {client_id} 的流式转录器初始化成功")
     except Exception as e:
         logger.error(f"初始化流式转录器时出错: {str(e)}")
-        await websocket.send_json({
+        await send_json(websocket, {
             "type": "error",
             "message": f"初始化转录器失败: {str(e)}"
         })
         await websocket.close(code=1011, reason=f"初始化转录器失败: {str(e)}")
         return
     
-    active_connections[client_id] = websocket
-    
     try:
-        audio_buffer = []
-        sample_rate = 16000
-        
         while True:
             # 接收数据
             try:
@@ -393,52 +510,18 @@ async def websocket_stream(websocket: WebSocket, client_id: str):
                 text_data = message['text']
                 logger.info(f"收到文本消息: {text_data}")
                 
-                if text_data == "END_OF_AUDIO":
-                    logger.info(f"客户端 {client_id} 发送了END_OF_AUDIO信号")
-                    # 处理剩余的音频数据
-                    if audio_buffer:
-                        try:
-                            audio_samples = np.concatenate(audio_buffer)
-                            for speech_dict, speech_samples in vad_iterator(audio_samples):
-                                is_last = "end" in speech_dict
-                                for res in model.streaming_inference(speech_samples * 32768, is_last):
-                                    await websocket.send_json({
-                                        "type": "streaming_result",
-                                        "timestamps": res["timestamps"],
-                                        "text": res["text"]
-                                    })
-                        except Exception as e:
-                            logger.error(f"处理最终音频数据时出错: {str(e)}")
-                            await websocket.send_json({
-                                "type": "error",
-                                "message": f"处理音频失败: {str(e)}"
-                            })
-                    
-                    # 发送最终结果标记
-                    await websocket.send_json({
-                        "type": "final_result"
-                    })
-                    logger.info(f"客户端 {client_id} 的转录已完成")
-                    break
-                
-                elif text_data == "RESET":
-                    logger.info(f"客户端 {client_id} 请求重置")
-                    # 重置模型和VAD
+                data = None
+                handler = TEXT_COMMAND_HANDLERS.get(text_data)
+                if handler is None:
                     try:
-                        model.reset()
-                        vad_iterator = VADIterator(speech_pad_ms=300)
-                        streaming_transcribers[client_id]["vad_iterator"] = vad_iterator
-                        audio_buffer = []
-                        await websocket.send_json({
-                            "type": "reset_complete"
-                        })
-                        logger.info(f"客户端 {client_id} 重置完成")
-                    except Exception as e:
-                        logger.error(f"重置转录器时出错: {str(e)}")
-                        await websocket.send_json({
-                            "type": "error",
-                            "message": f"重置失败: {str(e)}"
-                        })
+                        data = orjson.loads(text_data)
+                        handler = JSON_MESSAGE_HANDLERS[data["type"]]
+                    except (orjson.JSONDecodeError, KeyError, TypeError):
+                        logger.warning(f"客户端 {client_id} 发送了未知的文本消息: {text_data}")
+                        continue
+                
+                if await handler(session, data):
+                    break
             
             elif 'bytes' in message:
                 # 处理二进制音频数据
@@ -448,35 +531,15 @@ async def websocket_stream(websocket: WebSocket, client_id: str):
                 # 将二进制数据转换为浮点数组
                 try:
                     # 假设音频数据是16位PCM
-                    import struct
-                    audio_samples = np.array(struct.unpack(f"{len(audio_data)//2}h", audio_data), dtype=np.float32) / 32768.0
-                    audio_buffer.append(audio_samples)
+                    audio_samples = pcm16_to_float32(audio_data)
+                    session.audio_buffer.append(audio_samples)
                     
                     # 处理音频数据
-                    for speech_dict, speech_samples in vad_iterator(audio_samples):
-                        if "start" in speech_dict:
-                            logger.debug(f"检测到语音开始")
-                            model.reset()
-                        is_last = "end" in speech_dict
-                        if is_last:
-                            logger.debug(f"检测到语音结束")
-                        
-                        try:
-                            for res in model.streaming_inference(speech_samples * 32768, is_last):
-                                await websocket.send_json({
-                                    "type": "streaming_result",
-                                    "timestamps": res["timestamps"],
-                                    "text": res["text"]
-                                })
-                        except Exception as e:
-                            logger.error(f"流式转录时出错: {str(e)}")
-                            await websocket.send_json({
-                                "type": "error",
-                                "message": f"转录失败: {str(e)}"
-                            })
+                    for text in await asyncio.to_thread(run_streaming_inference, session.model, session.vad_iterator, audio_samples):
+                        await websocket.send_text(text)
                 except Exception as e:
                     logger.error(f"处理音频数据时出错: {str(e)}")
-                    await websocket.send_json({
+                    await send_json(websocket, {
                         "type": "error",
                         "message": f"处理音频失败: {str(e)}"
                     })
@@ -487,7 +550,7 @@ async def websocket_stream(websocket: WebSocket, client_id: str):
     except Exception as e:
         logger.error(f"WebSocket错误: {str(e)}")
         try:
-            await websocket.send_json({
+            await send_json(websocket, {
                 "type": "error",
                 "message": f"服务器错误: {str(e)}"
             })
@@ -495,11 +558,9 @@ async def websocket_stream(websocket: WebSocket, client_id: str):
             pass
     
     finally:
-        logger.info(f"清理客户端 {client_id} 的资源")
-        if client_id in active_connections:
-            del active_connections[client_id]
-        if client_id in streaming_transcribers:
-            del streaming_transcribers[client_id]
+        logger.info(f"客户端 {client_id} 的连接已结束")
 
 if __name__ == "__main__":
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
+    # 与run.py共用启动流程：加载.env、确定工作进程数并导出WEB_CONCURRENCY与CPU线程设置
+    from run import main
+    main()
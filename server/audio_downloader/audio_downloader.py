@@ -54,6 +54,12 @@ class AudioDownloader:
             'quiet': True,
             'no_warnings': True
         }
+        if self.audio_format == 'wav':
+            # Write 16 kHz mono PCM16 directly, the format Whisper consumes,
+            # so the server can read the samples without decoding again
+            ydl_opts['postprocessor_args'] = {
+                'extractaudio': ['-ar', '16000', '-ac', '1', '-acodec', 'pcm_s16le'],
+            }
         
         try:
             with YoutubeDL(ydl_opts) as ydl:
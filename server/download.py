@@ -1,5 +1,5 @@
 from audio_downloader import AudioDownloader
-from stream_whisper.faster_whisper import FasterWhisperStream
+from stream_whisper.faster_whisper import DEFAULT_DEVICE, FasterWhisperStream
 import os
 
 def main():
@@ -13,7 +13,14 @@ def main():
     info = audio_downloader.download_audio(base_url)
     print(info)
     import asyncio
-    faster_whisper = FasterWhisperStream(output_path=subtitles_path,device="cuda",compute_type="float16")
+    # 离线下载转字幕不要求实时，默认用small模型，计算类型auto在GPU上为int8_float16、CPU上为int8，
+    # 显存占用和解码耗时明显低于float16，中文识别准确率基本不变；可用MODEL_SIZE/COMPUTE_TYPE/DEVICE覆盖
+    faster_whisper = FasterWhisperStream(
+        model_size=os.environ.get("MODEL_SIZE", "small"),
+        device=os.environ.get("DEVICE", DEFAULT_DEVICE),
+        compute_type=os.environ.get("COMPUTE_TYPE", "auto"),
+        output_path=subtitles_path
+    )
     vtt_name = asyncio.run(faster_whisper.transcribe_file(info))
     print(vtt_name)
 
@@ -2,14 +2,42 @@ import uvicorn
 import os
 from dotenv import load_dotenv
 
-# 加载环境变量
+# 加载环境变量，须在导入stream_whisper之前，其模块配置从环境变量读取
 load_dotenv()
 
-if __name__ == "__main__":
+from stream_whisper.faster_whisper import DEFAULT_DEVICE
+
+def worker_count(reload: bool = False) -> int:
+    """
+    uvicorn工作进程数：reload模式下只能单进程，否则WEB_CONCURRENCY优先；
+    每个工作进程各自加载一份模型，只有CPU推理默认按核数起进程，GPU上默认单进程，避免多份模型占满显存
+    """
+    if reload:
+        return 1
+    default = (os.cpu_count() or 1) if os.environ.get("DEVICE", DEFAULT_DEVICE) == "cpu" else 1
+    return int(os.environ.get("WEB_CONCURRENCY", default))
+
+def main():
+    """
+    按环境变量确定工作进程数与CPU线程设置并启动服务，app.main直接运行时也使用此入口
+    """
     # 获取配置
     host = os.getenv("HOST", "0.0.0.0")
     port = int(os.getenv("PORT", "8000"))
-    reload = os.getenv("RELOAD", "True").lower() == "true"
+    reload = os.getenv("RELOAD", "False").lower() == "true"
+    device = os.getenv("DEVICE", DEFAULT_DEVICE)
+    workers = worker_count(reload)
+    # 让工作进程知道实际的进程数（用于划分CPU线程）
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    if device != "cuda":
+        # CPU推理的oneDNN/OpenMP调优，须在工作进程导入torch之前设置；已有的环境变量优先
+        os.environ.setdefault("DNNL_DEFAULT_FPMATH_MODE", "BF16")
+        os.environ.setdefault("LRU_CACHE_CAPACITY", "1024")
+        os.environ.setdefault("THP_MEM_ALLOC_ENABLE", "1")
+        os.environ.setdefault("OMP_NUM_THREADS", str(max(1, (os.cpu_count() or 1) // workers)))
     
-    print(f"Starting Whisper Web API on {host}:{port}")
-    uvicorn.run("app.main:app", host=host, port=port, reload=reload) 
\ No newline at end of file
+    print(f"Starting Whisper Web API on {host}:{port} (workers={workers})")
+    uvicorn.run("app.main:app", host=host, port=port, reload=reload, workers=workers)
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,334 @@
 import os
+import asyncio
+import bisect
+import functools
+import hashlib
 import logging
+import math
+import operator
+import subprocess
+import shutil
+import tempfile
 import time
 import numpy as np
-from typing import List, Dict, Optional, Any, Generator, Tuple
-from queue import Queue
-from threading import Thread
-from datetime import timedelta
+from typing import TYPE_CHECKING, List, Dict, Optional, Any, AsyncIterator, Deque, Generator, Iterable, Iterator, Tuple, Union
+from collections import OrderedDict, deque
+from threading import Lock
+from dataclasses import dataclass
 from enum import Enum
-from faster_whisper import WhisperModel
+# faster-whisper/CTranslate2会加载CUDA、oneDNN等动态库，耗时且占内存，
+# 推迟到首次创建转录器时再导入，只导入本模块（如应用启动时注册路由）不付出这部分开销
+if TYPE_CHECKING:
+    from faster_whisper import WhisperModel
+    from faster_whisper.transcribe import Segment
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 已加载的模型，按 (model_size, device, compute_type) 缓存，同一进程内的多个转录器共享权重
+_MODEL_CACHE: Dict[Tuple[str, str, str], "WhisperModel"] = {}
+_MODEL_CACHE_LOCK = Lock()
+# 跨流批处理器与模型一一对应，随模型一起卸载
+_STREAM_BATCHERS: Dict[Tuple[str, str, str], "StreamBatcher"] = {}
+
+# 限制同时进行的转录数量，避免并发请求超出显存；首次使用时才读取MAX_CONCURRENT_TRANSCRIPTIONS，
+# 入口脚本在导入本模块之后加载的.env也能生效
+_TRANSCRIBE_SEMAPHORE: Optional[asyncio.Semaphore] = None
+
+# 一次C级调用取出字幕所需的字段，代替逐个属性访问
+_SEGMENT_FIELDS = operator.attrgetter("start", "end", "text")
+_VTT_HEADER = "WEBVTT\n\n"
+# 不超过模型一个输入块（30秒）的已解码音频可与其他请求合并批量推理
+_BATCH_CLIP_SAMPLES = 16000 * 30
+
+# CTranslate2支持的计算类型，auto表示按设备自动选择
+_COMPUTE_TYPES = frozenset({"auto", "int8", "int8_float16", "int8_bfloat16", "int8_float32",
+                            "float16", "bfloat16", "float32"})
+
+# 未设置DEVICE环境变量时使用的设备，run.py、download.py与浏览器扩展接口共用
+DEFAULT_DEVICE = "cuda"
+
+# 模型下载及预量化模型的存放目录
+_MODELS_DIR = os.path.join(os.path.dirname(__file__), "models")
+# 面向低延迟流式场景的简写，对应faster-whisper内置的Distil-Whisper模型（仅支持英语）；
+# 蒸馏模型只有2层解码器，KV cache小得多，解码速度约为同尺寸Whisper的数倍
+_MODEL_SIZE_ALIASES = {"fast": "distil-small.en", "fast-en": "distil-medium.en", "fast-large": "distil-large-v3"}
+# faster-whisper的模型别名对应的Hugging Face原始模型
+_OPENAI_MODEL_ALIASES = {"large": "large-v3", "turbo": "large-v3-turbo"}
+
+def _transcribe_semaphore() -> asyncio.Semaphore:
+    """
+    返回限制同时转录数量的信号量，首次调用时创建
+    """
+    global _TRANSCRIBE_SEMAPHORE
+    if _TRANSCRIBE_SEMAPHORE is None:
+        _TRANSCRIBE_SEMAPHORE = asyncio.Semaphore(int(os.environ.get("MAX_CONCURRENT_TRANSCRIPTIONS", "1")))
+    return _TRANSCRIBE_SEMAPHORE
+
+def prequantized_model_path(model_size: str, compute_type: str) -> Optional[str]:
+    """
+    返回按compute_type预量化并保存在磁盘上的CTranslate2模型目录，不存在时先转换一次
+
+    faster-whisper默认下载的模型在每次加载时都要按compute_type重新量化权重；
+    预量化后直接加载目录即可跳过这一步。仅在PREQUANTIZE_MODEL=True时启用，
+    需要安装transformers，compute_type为auto或model_size为本地路径时不处理
+
+    Returns:
+        预量化模型目录，无法预量化时返回None
+    """
+    if os.environ.get("PREQUANTIZE_MODEL", "False").lower() != "true":
+        return None
+    if compute_type == "auto" or os.path.isdir(model_size) or model_size.startswith("distil"):
+        return None
+    
+    output_dir = os.path.join(_MODELS_DIR, f"{model_size}-{compute_type}")
+    if os.path.exists(os.path.join(output_dir, "model.bin")):
+        return output_dir
+    
+    hf_model = f"openai/whisper-{_OPENAI_MODEL_ALIASES.get(model_size, model_size)}"
+    tmp_dir = f"{output_dir}.{os.getpid()}.tmp"
+    logger.info(f"首次使用，预量化模型 {hf_model} -> {output_dir} ({compute_type})")
+    try:
+        subprocess.run(
+            [
+                "ct2-transformers-converter", "--model", hf_model, "--output_dir", tmp_dir,
+                "--copy_files", "tokenizer.json", "preprocessor_config.json",
+                "--quantization", compute_type, "--force",
+            ],
+            check=True, capture_output=True, text=True,
+        )
+        os.replace(tmp_dir, output_dir)
+        return output_dir
+    except (OSError, subprocess.CalledProcessError) as e:
+        detail = e.stderr if isinstance(e, subprocess.CalledProcessError) else str(e)
+        logger.warning(f"预量化模型失败，使用在线模型: {detail}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return None
+
+def load_whisper_model(model_size: str, device: str, compute_type: str) -> "WhisperModel":
+    """
+    获取共享的WhisperModel实例，首次请求时加载
+
+    加载在锁内完成，并发请求同一模型时只会加载一次
+    """
+    key = (model_size, device, compute_type)
+    with _MODEL_CACHE_LOCK:
+        model = _MODEL_CACHE.get(key)
+        if model is not None:
+            logger.info(f"复用已加载的模型: {key}")
+            return model
+        
+        # 多个uvicorn工作进程时平分CPU核，避免线程超额订阅
+        default_threads = max(1, (os.cpu_count() or 1) // int(os.environ.get("WEB_CONCURRENCY", "1")))
+        cpu_threads = int(os.environ.get("CPU_THREADS", default_threads))
+        # num_workers>1时多个请求共享同一份权重并行推理
+        num_workers = int(os.environ.get("NUM_WORKERS", "2" if device == "cuda" else "1"))
+        logger.info(f"加载模型: {key}, cpu_threads={cpu_threads}, num_workers={num_workers}")
+        
+        from faster_whisper import WhisperModel
+        
+        start_time = time.time()
+        model = WhisperModel(
+            prequantized_model_path(model_size, compute_type) or model_size,
+            device=device,
+            compute_type=compute_type,
+            cpu_threads=cpu_threads,
+            num_workers=num_workers,
+            download_root=_MODELS_DIR
+        )
+        load_time = time.time() - start_time
+        logger.info(f"模型加载完成，耗时 {load_time:.2f} 秒，实际计算类型: {getattr(model.model, 'compute_type', compute_type)}")
+        _warmup_model(model)
+        _MODEL_CACHE[key] = model
+        return model
+
+def unload_whisper_model(model: "WhisperModel"):
+    """
+    从共享缓存中移除模型，最后一个引用释放后CTranslate2随即回收显存/内存
+    """
+    with _MODEL_CACHE_LOCK:
+        for key, cached in list(_MODEL_CACHE.items()):
+            if cached is model:
+                del _MODEL_CACHE[key]
+                _STREAM_BATCHERS.pop(key, None)
+                logger.info(f"已卸载模型: {key}")
+
+@functools.lru_cache(maxsize=8)
+def _resample_filter(up: int, down: int) -> np.ndarray:
+    """
+    按scipy.signal.resample_poly的默认设计生成抗混叠FIR滤波器，同一采样率只设计一次
+    """
+    # scipy只在输入不是16kHz时才需要，按需导入
+    from scipy.signal import firwin
+    max_rate = max(up, down)
+    half_len = 10 * max_rate
+    return firwin(2 * half_len + 1, 1.0 / max_rate, window=("kaiser", 5.0))
+
+def _resample_to_16k(audio: np.ndarray, sample_rate: int) -> np.ndarray:
+    """
+    多相滤波重采样到16kHz；流式音频块各自独立重采样，块边界处有轻微的滤波边缘效应
+    """
+    from scipy.signal import resample_poly
+    g = math.gcd(sample_rate, 16000)
+    up, down = 16000 // g, sample_rate // g
+    resampled = resample_poly(audio, up, down, window=_resample_filter(up, down))
+    return resampled.astype(np.float32, copy=False)
+
+def _warmup_model(model: "WhisperModel"):
+    """
+    用静音做两次推理预热模型（1秒和一个完整的30秒窗口），
+    让CUDA内核编译、cuBLAS调优在启动时完成，而不是由首个请求承担
+    """
+    try:
+        start_time = time.time()
+        for seconds in (1, 30):
+            segments, _ = model.transcribe(
+                np.zeros(16000 * seconds, dtype=np.float32),
+                language="en", vad_filter=False, word_timestamps=False
+            )
+            for _ in segments:
+                pass
+        logger.info(f"模型预热完成，耗时 {time.time() - start_time:.2f} 秒")
+    except Exception as e:
+        logger.warning(f"模型预热失败: {str(e)}")
+
+@dataclass(slots=True)
+class StreamSegment:
+    """
+    流式转录得到的片段，时间为整条音频流上的秒数；只保留字幕需要的字段
+    """
+    start: float
+    end: float
+    text: str
+
+class StreamBatcher:
+    """
+    把共享同一模型的多个流式转录器同时就绪的窗口、以及同时到达的短音频文件合并为一次批量推理
+
+    窗口提交后最多等待max_wait秒，凑满max_batch_size个窗口时立即推理。
+    各窗口拼接为一段音频，以clip_timestamps标出各自的范围交给BatchedInferencePipeline，
+    编码器与解码器对整批只各调用一次，结果再按片段起点分回各窗口。
+    只有语言、任务与解码参数相同的窗口才会合并；每个窗口不能超过30秒（模型的一个输入块）
+    """
+
+    # 除language与beam_size外，原样传给BatchedInferencePipeline.transcribe的参数
+    _OPTIONS = ("task", "best_of", "temperature", "max_new_tokens")
+
+    def __init__(self, model: "WhisperModel", max_batch_size: int, max_wait: float):
+        from faster_whisper import BatchedInferencePipeline
+
+        self.pipeline = BatchedInferencePipeline(model=model)
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._waiting: Deque[Tuple[np.ndarray, Dict[str, Any], asyncio.Future]] = deque()
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+
+    async def transcribe(self, audio: np.ndarray, kwargs: Dict[str, Any]) -> List[Tuple[float, float, str]]:
+        """
+        转录一个窗口，须在事件循环中调用；kwargs中的language必须已确定
+
+        Returns:
+            (起始时间, 结束时间, 文本) 列表，时间相对于窗口起点
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._waiting.append((audio, kwargs, future))
+        if len(self._waiting) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        groups: Dict[Tuple, List[Tuple[np.ndarray, Dict[str, Any], asyncio.Future]]] = {}
+        while self._waiting:
+            item = self._waiting.popleft()
+            kwargs = item[1]
+            key = (kwargs["language"], kwargs["beam_size"], *(kwargs.get(name) for name in self._OPTIONS))
+            groups.setdefault(key, []).append(item)
+        for items in groups.values():
+            for i in range(0, len(items), self.max_batch_size):
+                task = asyncio.create_task(self._run(items[i:i + self.max_batch_size]))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, items: List[Tuple[np.ndarray, Dict[str, Any], asyncio.Future]]):
+        windows = [(audio, kwargs) for audio, kwargs, _ in items]
+        try:
+            if "task" in items[0][1]:
+                # 带task的是合并的音频文件（按task分组，同批都是文件），整批与逐个转录的文件
+                # 一样占用一个MAX_CONCURRENT_TRANSCRIPTIONS名额；流式窗口与逐窗口转录时一样不受限制
+                async with _transcribe_semaphore():
+                    results = await asyncio.to_thread(self._transcribe_batch, windows)
+            else:
+                results = await asyncio.to_thread(self._transcribe_batch, windows)
+        except Exception as e:
+            for _, _, future in items:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, _, future), result in zip(items, results):
+            if not future.done():
+                future.set_result(result)
+
+    def _transcribe_batch(self, windows: List[Tuple[np.ndarray, Dict[str, Any]]]) -> List[List[Tuple[float, float, str]]]:
+        from faster_whisper.vad import get_speech_timestamps
+
+        bounds = np.cumsum([0] + [audio.shape[0] for audio, _ in windows]).tolist()
+        clips = []
+        owners = []
+        for i, (audio, kwargs) in enumerate(windows):
+            start, end = 0, audio.shape[0]
+            if kwargs["vad_filter"]:
+                # 与逐窗口转录一致先做VAD，没有语音的窗口不进入批次，有语音的裁掉首尾静音
+                speech = get_speech_timestamps(audio, kwargs["vad_parameters"])
+                if not speech:
+                    continue
+                start, end = speech[0]["start"], speech[-1]["end"]
+            clips.append({"start": bounds[i] + start, "end": bounds[i] + end})
+            owners.append(i)
+        results: List[List[Tuple[float, float, str]]] = [[] for _ in windows]
+        if not clips:
+            return results
+
+        kwargs = windows[owners[0]][1]
+        options = {name: kwargs[name] for name in self._OPTIONS if name in kwargs}
+        segments, _ = self.pipeline.transcribe(
+            np.concatenate([audio for audio, _ in windows]),
+            language=kwargs["language"],
+            beam_size=kwargs["beam_size"],
+            without_timestamps=False,
+            vad_filter=False,
+            clip_timestamps=clips,
+            batch_size=len(clips),
+            **options,
+        )
+        # 流水线输出的时间保留3位小数，clip起点也按同样精度取整后再比较，
+        # 否则起点不在整毫秒上的clip，其第一个片段会被归到前一个clip
+        clip_starts = [round(clip["start"] / 16000, 3) for clip in clips]
+        for start, end, text in map(_SEGMENT_FIELDS, segments):
+            # 片段时间以所在窗口在拼接音频中的起点为基准，按起点归属到对应窗口
+            k = max(bisect.bisect_right(clip_starts, start) - 1, 0)
+            base = bounds[owners[k]] / 16000
+            results[owners[k]].append((max(start - base, 0.0), min(end, clips[k]["end"] / 16000) - base, text))
+        return results
+
+def get_stream_batcher(key: Tuple[str, str, str], model: "WhisperModel", max_batch_size: int,
+                       max_wait: float) -> StreamBatcher:
+    """
+    获取与共享模型对应的跨流批处理器，同一模型的所有流式转录器使用同一个
+    """
+    with _MODEL_CACHE_LOCK:
+        batcher = _STREAM_BATCHERS.get(key)
+        if batcher is None or batcher.pipeline.model is not model:
+            batcher = _STREAM_BATCHERS[key] = StreamBatcher(model, max_batch_size, max_wait)
+        return batcher
+
 class FasterWhisperStream:
     """
     基于faster-whisper的流式转录实现
@@ -22,8 +338,8 @@ class FasterWhisperStream:
     def __init__(
         self,
         model_size: str = "base",
-        device: str = "cpu",
-        compute_type: str = "int8",
+        device: Optional[str] = None,
+        compute_type: Optional[str] = None,
         language: Optional[str] = None,
         beam_size: int = 5,
         vad_filter: bool = True,
@@ -34,37 +350,59 @@ class FasterWhisperStream:
         初始化流式转录器
         
         Args:
-            model_size: 模型大小 ("tiny", "base", "small", "medium", "large")
-            device: 设备 ("cpu", "cuda", "auto")
-            compute_type: 计算类型 ("float16", "int8")
+            model_size: 模型大小 ("tiny", "base", "small", "medium", "large")，
+                也可用"distil-large-v3"等Distil-Whisper模型或简写"fast"/"fast-en"/"fast-large"（仅英语）
+            device: 设备 ("cpu", "cuda", "auto")，默认读取DEVICE环境变量，未设置时为DEFAULT_DEVICE
+            compute_type: 计算类型 ("auto", "float16", "int8", "int8_float16"等)，默认auto由CTranslate2按设备选择最快的类型
             language: 语言代码 (如 "zh", "en", None 表示自动检测)
             beam_size: 束搜索大小
             vad_filter: 是否使用语音活动检测
             vad_parameters: VAD参数
         """
+        from faster_whisper import BatchedInferencePipeline
+        from faster_whisper.vad import VadOptions, get_vad_model
+
         # 从环境变量读取配置
         model_size = model_size or os.environ.get("MODEL_SIZE", "base")
-        device = device or os.environ.get("DEVICE", "cpu")
-        compute_type = compute_type or os.environ.get("COMPUTE_TYPE", "int8")
+        model_size = _MODEL_SIZE_ALIASES.get(model_size, model_size)
+        device = device or os.environ.get("DEVICE", DEFAULT_DEVICE)
+        compute_type = self._resolve_compute_type(device, compute_type or os.environ.get("COMPUTE_TYPE", "auto"))
+        self.model_size = model_size
+        self.device = device
+        self.compute_type = compute_type
         self.output_path = output_path or os.environ.get("OUTPUT_PATH", "subtitles")
         
         logger.info(f"初始化FasterWhisperStream: model_size={model_size}, device={device}, compute_type={compute_type}")
         
         # 加载模型
         try:
-            start_time = time.time()
-            self.model = WhisperModel(
-                model_size,
-                device=device,
-                compute_type=compute_type,
-                download_root=os.path.join(os.path.dirname(__file__), "models")
-            )
-            load_time = time.time() - start_time
-            logger.info(f"模型加载完成，耗时 {load_time:.2f} 秒")
+            self.model = load_whisper_model(model_size, device, compute_type)
         except Exception as e:
             logger.error(f"模型加载失败: {str(e)}")
             raise
         
+        # 批量推理管线按VAD在静音处切分音频，各片段独立成批解码（不携带跨片段上下文）。
+        # BATCHED_INFERENCE默认auto仅在GPU上启用，设为true时CPU上也启用，false则关闭
+        self.batch_size = int(os.environ.get("BATCH_SIZE", "8"))
+        batched_inference = os.environ.get("BATCHED_INFERENCE", "auto").lower()
+        if batched_inference == "auto":
+            use_batched = self.model.model.device == "cuda"
+        else:
+            use_batched = batched_inference == "true"
+        self.batched_model = None
+        if use_batched and self.batch_size > 1:
+            self.batched_model = BatchedInferencePipeline(model=self.model)
+            logger.info(f"已启用批量推理, batch_size={self.batch_size}")
+        # 启用批量推理时，多个流同时就绪的窗口及同时到达的短音频文件合并成一批推理，
+        # 最多等待STREAM_BATCH_WAIT_MS毫秒凑批
+        stream_batch_size = int(os.environ.get("STREAM_BATCH_SIZE", str(self.batch_size)))
+        self._batcher: Optional[StreamBatcher] = None
+        if self.batched_model is not None and stream_batch_size > 1:
+            self._batcher = get_stream_batcher(
+                (model_size, device, compute_type), self.model, stream_batch_size,
+                float(os.environ.get("STREAM_BATCH_WAIT_MS", "50")) / 1000,
+            )
+        
         # 转录参数
         self.language = language
         self.beam_size = beam_size
@@ -75,99 +413,552 @@ class FasterWhisperStream:
             "max_speech_duration_s": 30,
             "min_silence_duration_ms": 500
         }
+        if self.vad_filter:
+            # 提前加载Silero VAD模型，避免首个请求承担加载耗时
+            get_vad_model()
+        # 流式窗口的转录参数只构造一次，每个窗口直接复用；
+        # 各窗口独立解码，不以上一窗口的文本为条件，避免短窗口上的幻觉和重复
+        self._final_kwargs = dict(
+            language=self.language,
+            beam_size=self.beam_size,
+            vad_filter=self.vad_filter,
+            vad_parameters=VadOptions(**self.vad_parameters),
+            condition_on_previous_text=False,
+        )
+        # 中间窗口默认贪心解码且不做温度回退，解码耗时约为束搜索的1/beam_size；
+        # 束搜索只用于输入结束时的最后一个窗口。STREAM_PARTIAL_BEAM可调大中间窗口的束宽
+        self._partial_kwargs = dict(
+            self._final_kwargs,
+            beam_size=max(1, int(os.environ.get("STREAM_PARTIAL_BEAM", "1"))),
+            best_of=1,
+            temperature=0.0,
+        )
         
-        # 流式处理状态
-        self.audio_queue = Queue()
+        # 流式处理状态：音频块经deque交给事件循环中的处理任务，模型推理放到线程中执行
+        self.stream_window = float(os.environ.get("STREAM_WINDOW_SECONDS", "3"))
+        # 以250ms为RMS窗口、每50ms滑动一次，所有位置的RMS都低于该阈值时视为静音，跳过模型调用；设为0关闭
+        self.silence_rms = float(os.environ.get("STREAM_SILENCE_RMS", "0.01"))
+        self.silence_frame = int(os.environ.get("STREAM_SILENCE_FRAME_MS", "50")) * 16
+        self.silence_span = max(1, int(os.environ.get("STREAM_SILENCE_WINDOW_MS", "250")) * 16 // self.silence_frame)
+        # 收发都在事件循环线程中进行，append/popleft无需加锁；有新音频或输入结束时置位事件
+        self.audio_queue: Deque[np.ndarray] = deque()
+        self._audio_event = asyncio.Event()
+        self._input_closed = False
+        # 处理任务所在的事件循环，供其他线程提交音频块
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # 尚未被stream_transcribe取走的片段；新片段到达或流结束时置位事件
+        self._pending: Deque[StreamSegment] = deque()
+        self._pending_event = asyncio.Event()
         self.is_running = False
-        self.processing_thread = None
-        self.current_segments = []
+        self.processing_task: Optional[asyncio.Task] = None
+        self.current_segments: List[StreamSegment] = []
         self.is_final = False
+        # 当前缓冲区起点在整条音频流上的时间（秒）
+        self._stream_offset = 0.0
+        # 相邻窗口重叠的音频长度：上一窗口末尾的这段音频拷到下一窗口开头，给窗口边界提供上下文
+        self.stream_overlap = float(os.environ.get("STREAM_OVERLAP_SECONDS", "0.5"))
+        self._buf_carry = 0
+        self._last_end = 0.0
+        # 同时转录的窗口数，默认等于CTranslate2的并行推理数（NUM_WORKERS）
+        self.stream_parallelism = max(1, int(os.environ.get(
+            "STREAM_PARALLELISM", getattr(self.model.model, "num_workers", 1)
+        )))
+        self._window_slots = asyncio.Semaphore(self.stream_parallelism)
+        # 预分配的窗口缓冲区轮流使用：转录中的窗口各占一块，另有一块继续接收音频。
+        # 空闲缓冲区放在队列中，全部在使用时接收端等待，形成背压
+        self._free_buffers: "asyncio.Queue[np.ndarray]" = asyncio.Queue()
+        for _ in range(self.stream_parallelism + 1):
+            self._free_buffers.put_nowait(np.empty(16000 * 8, dtype=np.float32))
+        # 每项为 (缓冲区, 采样数, 起始时间, 是否最后一个窗口)
+        self._window_queue: "asyncio.Queue[Optional[Tuple[np.ndarray, int, float, bool]]]" = asyncio.Queue()
+        self._buf: Optional[np.ndarray] = None
+        self._buf_len = 0
+        
+        # 转录结果缓存，按 (音频SHA-256, language, task) 复用，重复上传同一音频时跳过推理
+        self.result_cache_size = int(os.environ.get("TRANSCRIPTION_CACHE_SIZE", "128"))
+        self._result_cache: "OrderedDict[Tuple[str, Optional[str], str], List[Tuple[float, float, str]]]" = OrderedDict()
+        
+    @staticmethod
+    def _resolve_compute_type(device: str, compute_type: str) -> str:
+        """
+        根据设备实际支持的计算类型校正compute_type
+
+        auto在GPU上优先int8_float16（INT8权重+Tensor Core），不支持INT8时用float16，
+        GPU上显式指定的int8同样升级为int8_float16；
+        在CPU上优先int8（oneDNN的INT8内核，AVX512-VNNI/AMX处理器上使用INT8 GEMM指令），不支持时用float32。
+        显式指定的类型不受支持时（如部分GPU禁用了INT8），
+        按 int8_float16 -> float16 -> int8 -> float32 的顺序降级。Ampere/Hopper等GPU可显式指定bfloat16
+
+        Args:
+            device: 设备 ("cpu", "cuda", "auto")
+            compute_type: 请求的计算类型
+
+        Returns:
+            实际使用的计算类型
+        """
+        import ctranslate2
+
+        if compute_type not in _COMPUTE_TYPES:
+            raise ValueError(f"不支持的计算类型: {compute_type}，可选值: {', '.join(sorted(_COMPUTE_TYPES))}")
+        if device == "auto":
+            device = "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+        try:
+            supported = ctranslate2.get_supported_compute_types(device)
+        except Exception as e:
+            logger.warning(f"无法获取{device}支持的计算类型: {str(e)}")
+            return compute_type
+        logger.info(f"{device}支持的计算类型: {', '.join(sorted(supported))}")
+        
+        if compute_type == "auto":
+            preferred = ("int8_float16", "float16") if device == "cuda" else ("int8", "float32")
+            for candidate in preferred:
+                if candidate in supported:
+                    logger.info(f"自动选择计算类型: {candidate}")
+                    return candidate
+            return compute_type
+        if device == "cuda" and compute_type == "int8" and "int8_float16" in supported:
+            # GPU上的int8即int8_float32，非量化部分按float32计算，换成int8_float16更快且更省显存
+            logger.info("GPU上将计算类型int8升级为int8_float16")
+            return "int8_float16"
+        if compute_type in supported:
+            return compute_type
+        for fallback in ("int8_float16", "float16", "int8", "float32"):
+            if fallback in supported:
+                logger.warning(f"{device}不支持计算类型{compute_type}，降级为{fallback}")
+                return fallback
+        return "auto"
         
     def start_processing(self):
         """
-        启动流式处理线程
+        在当前事件循环中启动流式处理任务
         """
         if self.is_running:
             return
         
         self.is_running = True
-        self.processing_thread = Thread(target=self._process_audio_queue)
-        self.processing_thread.daemon = True
-        self.processing_thread.start()
-        logger.info("流式处理线程已启动")
+        self.is_final = False
+        self.current_segments = []
+        self._pending.clear()
+        self._pending_event.clear()
+        # 启动前已通过add_audio_chunk入队的音频保留，由处理任务照常消费
+        self._input_closed = False
+        # 新的音频流重新检测语言
+        self._partial_kwargs["language"] = self._final_kwargs["language"] = self.language
+        self._stream_offset = 0.0
+        self._last_end = 0.0
+        self._loop = asyncio.get_running_loop()
+        self.processing_task = asyncio.create_task(self._process_audio_queue())
+        logger.info("流式处理任务已启动")
         
-    def stop_processing(self):
+    async def stop_processing(self):
         """
-        停止流式处理线程
+        结束音频输入，等待剩余音频处理完毕后停止流式处理任务
         """
+        if not self.is_running:
+            return
         self.is_running = False
-        if self.processing_thread:
-            self.processing_thread.join(timeout=2.0)
-            self.processing_thread = None
-        logger.info("流式处理线程已停止")
+        self._input_closed = True
+        self._audio_event.set()
+        if self.processing_task:
+            await self.processing_task
+            self.processing_task = None
+        logger.info("流式处理任务已停止")
 
-    async def transcribe_file(self, file_path: str, language: Optional[str] = None, task: str = "transcribe") -> str:
+    def add_audio_chunk(self, audio_chunk: np.ndarray, sample_rate: int = 16000):
+        """
+        添加一段音频，可在任意线程中调用（如声卡采集回调）；
+        格式转换在调用线程中完成，其他线程的音频块经call_soon_threadsafe交给事件循环入队
+
+        Args:
+            audio_chunk: float32音频或16位PCM（int16），二维数组按(采样, 声道)下混为单声道
+            sample_rate: 采样率，非16kHz时用多相滤波重采样到16kHz
+        """
+        audio_chunk = self._prepare_chunk(audio_chunk, sample_rate)
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if self._loop is None or running is self._loop:
+            self._enqueue(audio_chunk)
+        else:
+            self._loop.call_soon_threadsafe(self._enqueue, audio_chunk)
+
+    async def aadd_audio_chunk(self, audio_chunk: np.ndarray, sample_rate: int = 16000):
+        """
+        在事件循环中添加一段音频；需要重采样时转换放到线程中执行，不阻塞事件循环。
+        同一流的音频块须依次await，保证入队顺序
+
+        Args:
+            audio_chunk: 同add_audio_chunk
+            sample_rate: 同add_audio_chunk
+        """
+        if sample_rate != 16000:
+            audio_chunk = await asyncio.to_thread(self._prepare_chunk, audio_chunk, sample_rate)
+        else:
+            audio_chunk = self._prepare_chunk(audio_chunk, sample_rate)
+        self._enqueue(audio_chunk)
+
+    def _enqueue(self, audio_chunk: np.ndarray):
+        self.audio_queue.append(audio_chunk)
+        self._audio_event.set()
+
+    @staticmethod
+    def _prepare_chunk(audio_chunk: np.ndarray, sample_rate: int) -> np.ndarray:
+        """
+        将音频块统一为16kHz单声道的连续float32数组
+        """
+        # 入队前统一为连续的float32，之后拷贝进窗口缓冲区和送入模型时都不再转换
+        audio_chunk = np.asarray(audio_chunk)
+        if audio_chunk.dtype == np.int16:
+            # 类型转换与归一化在一次遍历中完成
+            audio_chunk = np.multiply(audio_chunk, np.float32(1.0 / 32768.0), dtype=np.float32)
+        audio_chunk = np.ascontiguousarray(audio_chunk, dtype=np.float32)
+        if audio_chunk.ndim == 2:
+            # 在float32上求和再缩放，mean会先提升到float64
+            audio_chunk = np.add.reduce(audio_chunk, axis=1) * np.float32(1.0 / audio_chunk.shape[1])
+        if sample_rate != 16000:
+            audio_chunk = _resample_to_16k(audio_chunk, sample_rate)
+        return audio_chunk
+
+    async def _process_audio_queue(self):
+        """
+        累积音频到stream_window秒后提交一个窗口转录，输入结束后提交剩余音频；
+        转录在另一个任务中进行，期间继续向另一块缓冲区接收音频
+        """
+        window = int(self.stream_window * 16000)
+        windows_task = asyncio.create_task(self._transcribe_windows())
+        self._buf = await self._free_buffers.get()
+        self._buf_len = 0
+        self._buf_carry = 0
+        try:
+            while True:
+                if not self.audio_queue:
+                    if self._input_closed:
+                        break
+                    # 队列已取空才清除事件，单线程下检查与等待之间不会漏掉新音频
+                    self._audio_event.clear()
+                    await self._audio_event.wait()
+                    continue
+                # 已积压的音频块连续取出，只在凑满窗口提交时让出事件循环
+                self._append_to_buffer(self.audio_queue.popleft())
+                if self._buf_len >= window:
+                    await self._submit_window()
+        except Exception as e:
+            logger.error(f"流式转录失败: {str(e)}")
+        finally:
+            # 只剩上一窗口带过来的重叠部分时没有新音频，不再提交
+            if self._buf_len > self._buf_carry:
+                self._window_queue.put_nowait((self._buf, self._buf_len, self._stream_offset, True))
+            else:
+                self._free_buffers.put_nowait(self._buf)
+            self._buf = None
+            self._buf_len = 0
+            self._buf_carry = 0
+            self._window_queue.put_nowait(None)
+            await windows_task
+            self.is_final = True
+            self._pending_event.set()
+
+    async def _submit_window(self):
+        """
+        提交当前缓冲区转录，换一块空闲缓冲区并把末尾的重叠音频拷到开头
+        """
+        buf, length = self._buf, self._buf_len
+        self._window_queue.put_nowait((buf, length, self._stream_offset, False))
+        carry = min(int(self.stream_overlap * 16000), length)
+        self._stream_offset += (length - carry) / 16000
+        self._buf = await self._free_buffers.get()
+        if carry > self._buf.shape[0]:
+            self._buf = np.empty(max(carry, 16000 * 8), dtype=np.float32)
+        # 提交的缓冲区此时只会被模型读取，可以安全地拷出重叠部分
+        self._buf[:carry] = buf[length - carry:length]
+        self._buf_len = carry
+        self._buf_carry = carry
+
+    async def _transcribe_windows(self):
+        """
+        为每个提交的窗口启动转录任务，最多stream_parallelism个窗口同时推理，结果按窗口顺序发布
+        """
+        previous: Optional[asyncio.Task] = None
+        while True:
+            item = await self._window_queue.get()
+            if item is None:
+                break
+            buf, length, offset, final = item
+            previous = asyncio.create_task(self._transcribe_window(buf, length, offset, final, previous))
+        if previous:
+            await previous
+
+    async def _transcribe_window(self, buf: np.ndarray, length: int, offset: float, final: bool,
+                                 previous: Optional[asyncio.Task]):
+        """
+        转录一个窗口并归还其缓冲区，等前一个窗口发布后再发布本窗口的片段
+        """
+        try:
+            async with self._window_slots:
+                segments = await self._transcribe_audio(buf[:length], offset, final)
+        except Exception as e:
+            logger.error(f"流式转录失败: {str(e)}")
+            segments = []
+        finally:
+            self._free_buffers.put_nowait(buf)
+        if previous:
+            await previous
+        # 重叠区域的语音在上一窗口已经输出过，中点落在已输出范围内的片段视为重复丢弃
+        last_end = self._last_end
+        segments = [segment for segment in segments if (segment.start + segment.end) / 2 >= last_end]
+        if segments:
+            self._last_end = max(last_end, segments[-1].end)
+            self.current_segments.extend(segments)
+            self._pending.extend(segments)
+            self._pending_event.set()
+
+    def _append_to_buffer(self, chunk: np.ndarray):
+        """
+        将音频块拷入窗口缓冲区，容量不足时按倍数扩容
+        """
+        n = chunk.shape[0]
+        end = self._buf_len + n
+        if end > self._buf.shape[0]:
+            grown = np.empty(max(self._buf.shape[0] * 2, end), dtype=np.float32)
+            grown[:self._buf_len] = self._buf[:self._buf_len]
+            self._buf = grown
+        self._buf[self._buf_len:end] = chunk
+        self._buf_len = end
+
+    def _is_silent(self, audio: np.ndarray) -> bool:
+        """
+        按滑动窗口计算RMS判断窗口是否为纯静音，静音窗口不必经过编码器
+        """
+        if self.silence_rms <= 0 or audio.shape[0] == 0:
+            return False
+        frame = min(self.silence_frame, audio.shape[0])
+        frames = audio[:audio.shape[0] // frame * frame].reshape(-1, frame)
+        # einsum逐帧求平方和，不生成平方后的临时数组
+        energy = np.einsum("ij,ij->i", frames, frames)
+        # 相邻silence_span帧的平方和即一个RMS窗口的能量，窗口每次滑动一帧
+        span = min(self.silence_span, energy.shape[0])
+        if span > 1:
+            energy = np.convolve(energy, np.ones(span, dtype=energy.dtype), mode="valid")
+        return float(energy.max()) < self.silence_rms * self.silence_rms * frame * span
+
+    async def _transcribe_audio(self, audio: np.ndarray, offset: float, final: bool = False) -> List[StreamSegment]:
+        """
+        转录一个窗口的音频，片段时间加上offset换算为整条音频流上的时间
+
+        Args:
+            audio: 窗口音频
+            offset: 窗口起点在整条音频流上的时间（秒）
+            final: 是否为输入结束后的最后一个窗口，是则使用束搜索
+        """
+        if self._is_silent(audio):
+            return []
+        kwargs = self._final_kwargs if final else self._partial_kwargs
+        if self._batcher is not None and kwargs["language"] is not None and audio.shape[0] <= _BATCH_CLIP_SAMPLES:
+            # 语言已确定的窗口交给跨流批处理；语言未定的窗口仍单独转录以检测语言，
+            # 推理积压时累积超过30秒的窗口也单独转录，避免被截断
+            segments = await self._batcher.transcribe(audio, kwargs)
+            return [StreamSegment(start + offset, end + offset, text) for start, end, text in segments]
+
+        def transcribe() -> Tuple[List[StreamSegment], Any]:
+            segments, info = self.model.transcribe(audio, **kwargs)
+            return [StreamSegment(start + offset, end + offset, text) for start, end, text in map(_SEGMENT_FIELDS, segments)], info
+
+        segments, info = await asyncio.to_thread(transcribe)
+        if self._partial_kwargs["language"] is None and segments:
+            # 未指定语言时，首个有内容的窗口检测出语言后固定下来，后续窗口跳过语言检测
+            self._partial_kwargs["language"] = self._final_kwargs["language"] = info.language
+            logger.info(f"流式转录语言固定为: {info.language} (概率 {info.language_probability:.2f})")
+        return segments
+
+    async def stream_transcribe(self) -> AsyncIterator[StreamSegment]:
+        """
+        按时间顺序产出流式转录得到的片段，音频输入结束且全部处理完后停止
+        """
+        while True:
+            await self._pending_event.wait()
+            self._pending_event.clear()
+            # 一次唤醒取走所有已到达的片段
+            while self._pending:
+                yield self._pending.popleft()
+            if self.is_final:
+                break
+
+    async def finalize(self) -> List[StreamSegment]:
+        """
+        结束流式输入并返回全部片段
+        """
+        await self.stop_processing()
+        return self.current_segments
+
+    async def transcribe_stream(
+        self,
+        audio: Union[str, np.ndarray],
+        language: Optional[str] = None,
+        task: str = "transcribe",
+        vad_filter: Optional[bool] = None
+    ) -> AsyncIterator["Segment"]:
+        """
+        逐段产出转录结果
+
+        faster-whisper返回的是惰性生成器，每次取下一段都会触发解码，
+        因此在线程中推进生成器，解码出一段就立即产出一段，不阻塞事件循环。
+        同时进行的转录数量受MAX_CONCURRENT_TRANSCRIPTIONS限制
+
+        Args:
+            audio: 音频文件路径，或已解码的16kHz单声道float32音频
+            language: 语言代码 (如 "zh", "en", None 表示自动检测)
+            task: 任务类型 ("transcribe" 或 "translate")
+            vad_filter: 是否使用VAD过滤静音，None表示使用初始化时的设置；
+                输入已经过VAD切分时可传False跳过（此时不使用批量推理，批量推理依赖VAD切分）
+        """
+        if vad_filter is None:
+            vad_filter = self.vad_filter
+        # faster-whisper会修改传入的vad_parameters，每次传入副本
+        kwargs = dict(language=language, task=task, max_new_tokens=42, vad_filter=vad_filter,
+                      vad_parameters=dict(self.vad_parameters))
+        async with _transcribe_semaphore():
+            if self.batched_model is not None and vad_filter:
+                segments, _ = await asyncio.to_thread(
+                    self.batched_model.transcribe, audio, batch_size=self.batch_size, **kwargs
+                )
+            else:
+                segments, _ = await asyncio.to_thread(self.model.transcribe, audio, **kwargs)
+            done = object()
+            while True:
+                segment = await asyncio.to_thread(next, segments, done)
+                if segment is done:
+                    break
+                yield segment
+
+    async def transcribe_file(
+        self,
+        file_path: Union[str, np.ndarray],
+        language: Optional[str] = None,
+        task: str = "transcribe",
+        file_name: Optional[str] = None
+    ) -> str:
         """
         转录文件
+
+        Args:
+            file_path: 音频文件路径，或已解码的16kHz单声道float32音频
+            file_name: 输出字幕的文件名（不含扩展名），传入音频数组时必须提供
         """
         # 输出当前目录
         logger.info(f"当前目录: {os.getcwd()}")
-        logger.info(f"开始转录文件: {file_path}")
-        # 获取文件名, 去掉扩展名
-        file_name = os.path.splitext(os.path.basename(file_path))[0]
-        segments, _ = self.model.transcribe(file_path, language=language, task=task, max_new_tokens=42)
-        # 将字幕转换为vtt格式 并保存
-        
-        vtt_content = self.convert_to_vtt(segments)
+        if isinstance(file_path, np.ndarray):
+            if not file_name:
+                raise ValueError("转录音频数组时必须提供file_name")
+            logger.info(f"开始转录音频数据: {file_name}, {len(file_path) / 16000:.1f} 秒")
+        else:
+            logger.info(f"开始转录文件: {file_path}")
+            # 获取文件名, 去掉扩展名
+            file_name = file_name or os.path.splitext(os.path.basename(file_path))[0]
+        cache_key = None
+        if self.result_cache_size > 0:
+            cache_key = (await asyncio.to_thread(self._audio_digest, file_path), language, task)
         vtt_name = f"{file_name}.vtt"
-        logger.info(f"vtt文件名: {vtt_name}")
         vtt_path = os.path.join(self.output_path, vtt_name)
         logger.info(f"vtt文件路径: {vtt_path}")
-        
+        os.makedirs(self.output_path, exist_ok=True)
 
+        # 边解码边写入同目录下的临时文件，完成并落盘后再用os.replace原子地替换目标文件，
+        # 读取方不会看到写了一半的字幕，也不需要在内存中拼出完整的vtt内容
+        fd, tmp_path = tempfile.mkstemp(dir=self.output_path, suffix=".vtt.tmp")
         try:
-            # Ensure the output directory exists
-            os.makedirs(self.output_path, exist_ok=True)
-            
-            with open(vtt_path, "w", encoding="utf-8") as f:
-                f.write(vtt_content)
+            os.fchmod(fd, 0o644)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                segments = self._result_cache.get(cache_key) if cache_key else None
+                if segments is not None:
+                    self._result_cache.move_to_end(cache_key)
+                    logger.info(f"命中转录缓存: {file_name}")
+                    f.writelines(self.convert_to_vtt(segments))
+                else:
+                    f.write(_VTT_HEADER)
+                    if self._can_coalesce(file_path, language):
+                        # 短音频与同时到达的其他短音频合并为一次批量推理，整批占用一个MAX_CONCURRENT_TRANSCRIPTIONS名额
+                        segments = await self._batcher.transcribe(
+                            file_path, dict(self._final_kwargs, language=language, task=task, max_new_tokens=42)
+                        )
+                        f.writelines(self._vtt_cue(*fields) for fields in segments)
+                    else:
+                        # 只保留字幕需要的字段，不持有每段的tokens等完整结果
+                        segments = []
+                        async for segment in self.transcribe_stream(file_path, language=language, task=task):
+                            fields = _SEGMENT_FIELDS(segment)
+                            segments.append(fields)
+                            f.write(self._vtt_cue(*fields))
+                    if cache_key:
+                        self._result_cache[cache_key] = segments
+                        while len(self._result_cache) > self.result_cache_size:
+                            self._result_cache.popitem(last=False)
+                f.flush()
+                await asyncio.to_thread(os.fsync, f.fileno())
+            os.replace(tmp_path, vtt_path)
             return vtt_name
-        except Exception as e:
-            logger.error(f"保存vtt文件失败: {str(e)}")
+        except BaseException as e:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            if isinstance(e, Exception):
+                logger.error(f"生成vtt文件失败: {str(e)}")
             raise
 
-    def convert_to_vtt(self, segments: List[Dict[str, Any]]) -> str:
+    def _can_coalesce(self, audio: Union[str, np.ndarray], language: Optional[str]) -> bool:
         """
-        将字幕转换为vtt格式
+        判断文件转录能否交给跨请求批处理：须为不超过30秒的已解码音频，且指定了语言
+        （批内共用一个语言，自动检测仍走单独转录）
         """
-        vtt_content = "WEBVTT\n\n"
-        for segment in segments:
-            start = self._format_timestamp(segment.start, "vtt")
-            end = self._format_timestamp(segment.end, "vtt")
-            text = segment.text.strip()
-            vtt_content += f"{start} --> {end}\n{text}\n\n"
-        return vtt_content
+        return (self._batcher is not None and language is not None
+                and isinstance(audio, np.ndarray) and audio.shape[0] <= _BATCH_CLIP_SAMPLES)
+
+    @staticmethod
+    def _audio_digest(audio: Union[str, np.ndarray], chunk_size: int = 1 << 20) -> str:
+        """
+        计算音频内容的SHA-256，文件按1MiB分块读取，不整体载入内存
+        """
+        digest = hashlib.sha256()
+        if isinstance(audio, np.ndarray):
+            digest.update(memoryview(np.ascontiguousarray(audio)).cast("B"))
+        else:
+            with open(audio, "rb") as f:
+                while chunk := f.read(chunk_size):
+                    digest.update(chunk)
+        return digest.hexdigest()
+
+    def _vtt_cue(self, start: float, end: float, text: str) -> str:
+        """
+        生成单条vtt字幕
+        """
+        return f"{self._format_timestamp(start)} --> {self._format_timestamp(end)}\n{text.strip()}\n\n"
+
+    def convert_to_vtt(self, segments: Iterable[Tuple[float, float, str]]) -> Iterator[str]:
+        """
+        将字幕转换为vtt格式，逐条产出文本片段，调用方可直接写入文件
+
+        Args:
+            segments: (start, end, text) 元组序列
+        """
+        yield _VTT_HEADER
+        vtt_cue = self._vtt_cue
+        for start, end, text in segments:
+            yield vtt_cue(start, end, text)
     
-    def _format_timestamp(self, seconds: float, subtitle_format: str) -> str:
+    def _format_timestamp(self, seconds: float, separator: str = ".") -> str:
         """
         格式化时间戳
         
         Args:
             seconds: 秒数
-            format: 字幕格式
+            separator: 秒与毫秒之间的分隔符，vtt为"."，srt为","，由调用方按字幕格式选定一次
             
         Returns:
             格式化的时间戳
         """
-        td = timedelta(seconds=seconds)
-        hours, remainder = divmod(td.seconds, 3600)
-        minutes, seconds = divmod(remainder, 60)
-        milliseconds = td.microseconds // 1000
-        
-        if subtitle_format == "vtt":
-            return f"{hours:02d}:{minutes:02d}:{seconds:02d}.{milliseconds:03d}"
-        elif subtitle_format == "srt":
-            return f"{hours:02d}:{minutes:02d}:{seconds:02d},{milliseconds:03d}"
-        else:
-            return f"{hours:02d}:{minutes:02d}:{seconds:02d}.{milliseconds:03d}"
-
+        # 全部在整数毫秒上计算，不构造timedelta，超过24小时也能正确显示；
+        # 四舍五入而非截断，避免2.9999这类浮点误差显示成2.999
+        milliseconds = int(seconds * 1000 + 0.5)
+        hours, milliseconds = divmod(milliseconds, 3_600_000)
+        minutes, milliseconds = divmod(milliseconds, 60_000)
+        seconds, milliseconds = divmod(milliseconds, 1000)
+        return "%02d:%02d:%02d%s%03d" % (hours, minutes, seconds, separator, milliseconds)
@@ -12,6 +12,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import threading
+from collections import OrderedDict
 from functools import partial
 from typing import List
 
@@ -24,7 +27,25 @@ from online_fbank import OnlineFbank
 from .sensevoice import SenseVoiceSmall
 
 
-sensevoice_models = {}
+# LRU cache of loaded models, bounded to avoid pinning every (model, device) pair
+sensevoice_models = OrderedDict()
+MAX_SENSEVOICE_MODELS = int(os.environ.get("MAX_SENSEVOICE_MODELS", "2"))
+# _models_lock guards the cache itself; per-key locks serialize the slow model load
+_models_lock = threading.Lock()
+_model_locks = {}
+
+
+def _release_model(key: str):
+    model, _ = sensevoice_models.pop(key)
+    del model
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+def clear_models():
+    with _models_lock:
+        for key in list(sensevoice_models):
+            _release_model(key)
 
 
 class StreamingSenseVoice:
@@ -87,12 +108,26 @@ class StreamingSenseVoice:
     @staticmethod
     def load_model(model: str, device: str) -> tuple:
         key = f"{model}-{device}"
-        if key not in sensevoice_models:
+        with _models_lock:
+            if key in sensevoice_models:
+                sensevoice_models.move_to_end(key)
+                return sensevoice_models[key]
+            key_lock = _model_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            # another thread may have finished loading while we waited
+            with _models_lock:
+                if key in sensevoice_models:
+                    sensevoice_models.move_to_end(key)
+                    return sensevoice_models[key]
             model, kwargs = SenseVoiceSmall.from_pretrained(model=model, device=device)
             model = model.to(device)
             model.eval()
-            sensevoice_models[key] = (model, kwargs)
-        return sensevoice_models[key]
+            with _models_lock:
+                sensevoice_models[key] = (model, kwargs)
+                while len(sensevoice_models) > max(MAX_SENSEVOICE_MODELS, 1):
+                    _release_model(next(iter(sensevoice_models)))
+                _model_locks.pop(key, None)
+                return sensevoice_models[key]
 
     def reset(self):
         self.cur_idx = -1
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 测试以server目录为根导入app与stream_whisper，与run.py的运行方式一致
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
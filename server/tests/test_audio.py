@@ -0,0 +1,242 @@
+import struct
+import wave
+
+import numpy as np
+import pytest
+
+from app import audio
+from app.audio import FRAME_SIZE, SAMPLE_RATE, AudioBufferPool, load_wav_pcm16, pcm16_to_float32, stereo_pcm16_to_float32
+
+
+@pytest.fixture(params=[True, False], ids=["numba", "numpy"])
+def kernels(request, monkeypatch):
+    """
+    分别用numba内核与numpy回退实现运行测试
+    """
+    if request.param and not audio.HAS_NUMBA:
+        pytest.skip("numba未安装")
+    monkeypatch.setattr(audio, "HAS_NUMBA", request.param)
+    return request.param
+
+
+def _pcm(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(-32768, 32768, size=count, dtype=np.int16)
+
+
+@pytest.mark.parametrize("count", [0, 1, 17, FRAME_SIZE - 1, FRAME_SIZE, FRAME_SIZE + 1, 3 * FRAME_SIZE])
+def test_pcm16_to_float32_matches_reference(kernels, count):
+    pcm = _pcm(count)
+    result = pcm16_to_float32(pcm)
+    assert result.dtype == np.float32
+    np.testing.assert_array_equal(result, pcm.astype(np.float32) / 32768.0)
+
+
+def test_pcm16_to_float32_accepts_bytes(kernels):
+    pcm = np.array([-32768, -1, 0, 1, 16384, 32767], dtype=np.int16)
+    result = pcm16_to_float32(pcm.tobytes())
+    np.testing.assert_array_equal(result, [-1.0, -1 / 32768, 0.0, 1 / 32768, 0.5, 32767 / 32768])
+
+
+def test_pcm16_to_float32_writes_into_out(kernels):
+    pcm = _pcm(FRAME_SIZE)
+    out = np.full(FRAME_SIZE + 8, 7.0, dtype=np.float32)
+    result = pcm16_to_float32(pcm, out=out[:FRAME_SIZE])
+    assert np.shares_memory(result, out)
+    np.testing.assert_array_equal(out[:FRAME_SIZE], pcm.astype(np.float32) / 32768.0)
+    # 不得写出out的范围
+    assert (out[FRAME_SIZE:] == 7.0).all()
+
+
+@pytest.mark.parametrize("out", [
+    np.empty(FRAME_SIZE - 1, dtype=np.float32),
+    np.empty(FRAME_SIZE + 1, dtype=np.float32),
+    np.empty(FRAME_SIZE, dtype=np.float64),
+])
+def test_pcm16_to_float32_rejects_mismatched_out(kernels, out):
+    with pytest.raises(ValueError):
+        pcm16_to_float32(_pcm(FRAME_SIZE), out=out)
+
+
+def _downmix_reference(pcm):
+    pair = pcm[:pcm.shape[0] // 2 * 2].reshape(-1, 2).astype(np.int32)
+    return ((pair[:, 0] >> 1) + (pair[:, 1] >> 1)).astype(np.float32) / 32768.0
+
+
+@pytest.mark.parametrize("count", [0, 2, 34, 2 * FRAME_SIZE, 2 * FRAME_SIZE + 6])
+def test_stereo_pcm16_to_float32_downmixes(kernels, count):
+    pcm = _pcm(count, seed=1)
+    result = stereo_pcm16_to_float32(pcm)
+    assert result.dtype == np.float32
+    assert result.shape == (count // 2,)
+    np.testing.assert_array_equal(result, _downmix_reference(pcm))
+
+
+def test_stereo_pcm16_to_float32_does_not_overflow(kernels):
+    # 两个声道都是满幅时，先右移再相加，不会溢出int16
+    pcm = np.array([32767, 32767, -32768, -32768, 32767, -32768], dtype=np.int16)
+    result = stereo_pcm16_to_float32(pcm.tobytes())
+    np.testing.assert_array_equal(result, [32766 / 32768, -1.0, -1 / 32768])
+
+
+def test_stereo_pcm16_to_float32_ignores_trailing_sample(kernels):
+    pcm = np.array([100, 300, 500], dtype=np.int16)
+    np.testing.assert_array_equal(stereo_pcm16_to_float32(pcm), [200 / 32768])
+
+
+def _write_wav(path, pcm, channels=1, rate=SAMPLE_RATE, bits=16, format_tag=1, sub_format=None,
+               extra_chunks=b"", data_size=None):
+    """
+    手工拼出RIFF/WAVE文件，用于覆盖wave模块写不出的格式
+    """
+    data = pcm.tobytes()
+    block_align = channels * bits // 8
+    fmt = struct.pack("<HHIIHH", format_tag, channels, rate, rate * block_align, block_align, bits)
+    if sub_format is not None:
+        fmt += struct.pack("<HHI", 22, bits, 0) + struct.pack("<H", sub_format) + bytes(14)
+    body = b"WAVE" + b"fmt " + struct.pack("<I", len(fmt)) + fmt + extra_chunks
+    body += b"data" + struct.pack("<I", len(data) if data_size is None else data_size) + data
+    path.write_bytes(b"RIFF" + struct.pack("<I", len(body)) + body)
+    return path
+
+
+def test_load_wav_pcm16_reads_mono(tmp_path):
+    pcm = _pcm(SAMPLE_RATE + 3)
+    path = tmp_path / "mono.wav"
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(SAMPLE_RATE)
+        w.writeframes(pcm.tobytes())
+    np.testing.assert_array_equal(load_wav_pcm16(str(path)), pcm16_to_float32(pcm))
+
+
+def test_load_wav_pcm16_downmixes_stereo(tmp_path):
+    pcm = _pcm(2 * 1000, seed=2)
+    path = _write_wav(tmp_path / "stereo.wav", pcm, channels=2)
+    np.testing.assert_array_equal(load_wav_pcm16(str(path)), _downmix_reference(pcm))
+
+
+def test_load_wav_pcm16_accepts_extensible_and_skips_chunks(tmp_path):
+    pcm = _pcm(999, seed=3)
+    # 奇数长度的块后有一个填充字节
+    extra = b"LIST" + struct.pack("<I", 5) + b"abcde" + b"\0"
+    path = _write_wav(tmp_path / "ext.wav", pcm, format_tag=0xFFFE, sub_format=1, extra_chunks=extra)
+    np.testing.assert_array_equal(load_wav_pcm16(str(path)), pcm16_to_float32(pcm))
+
+
+def test_load_wav_pcm16_clamps_placeholder_data_size(tmp_path):
+    # 管道输出的WAV把data大小写成0xFFFFFFFF
+    pcm = _pcm(500, seed=4)
+    path = _write_wav(tmp_path / "pipe.wav", pcm, data_size=0xFFFFFFFF)
+    np.testing.assert_array_equal(load_wav_pcm16(str(path)), pcm16_to_float32(pcm))
+
+
+def test_load_wav_pcm16_empty_data(tmp_path):
+    path = _write_wav(tmp_path / "empty.wav", np.zeros(0, dtype=np.int16))
+    result = load_wav_pcm16(str(path))
+    assert result is not None and result.shape == (0,)
+
+
+@pytest.mark.parametrize("kwargs", [
+    dict(rate=44100),
+    dict(channels=3),
+    dict(format_tag=3),
+    dict(format_tag=0xFFFE, sub_format=3),
+], ids=["44.1kHz", "3ch", "float", "extensible-float"])
+def test_load_wav_pcm16_rejects_other_formats(tmp_path, kwargs):
+    path = _write_wav(tmp_path / "other.wav", _pcm(64), **kwargs)
+    assert load_wav_pcm16(str(path)) is None
+
+
+def test_load_wav_pcm16_rejects_8bit(tmp_path):
+    path = _write_wav(tmp_path / "u8.wav", np.full(64, 128, dtype=np.uint8), bits=8)
+    assert load_wav_pcm16(str(path)) is None
+
+
+@pytest.mark.parametrize("content", [
+    b"",
+    b"RIFF\0\0",
+    b"RIFX" + bytes(4) + b"WAVE",
+    b"RIFF" + bytes(4) + b"AVI ",
+    # data块出现在fmt块之前
+    b"RIFF" + bytes(4) + b"WAVE" + b"data" + struct.pack("<I", 4) + bytes(4),
+], ids=["empty", "truncated", "rifx", "not-wave", "data-before-fmt"])
+def test_load_wav_pcm16_rejects_malformed(tmp_path, content):
+    path = tmp_path / "bad.wav"
+    path.write_bytes(content)
+    assert load_wav_pcm16(str(path)) is None
+
+
+def test_load_wav_pcm16_missing_file(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        load_wav_pcm16(str(tmp_path / "missing.wav"))
+
+
+def _base(array):
+    return array if array.base is None else array.base
+
+
+def test_pool_reuses_released_buffer():
+    pool = AudioBufferPool()
+    first = pool.acquire(1000)
+    assert first.shape == (1000,) and first.dtype == np.float32
+    pool.release(first)
+    second = pool.acquire(800)
+    assert second.shape == (800,)
+    assert _base(second) is _base(first)
+    # 已取出的缓冲区不会再次分配给其他调用方
+    assert not np.shares_memory(pool.acquire(800), second)
+
+
+def test_pool_picks_smallest_fitting_buffer():
+    pool = AudioBufferPool(max_buffers=3)
+    small, large = pool.acquire(100), pool.acquire(10000)
+    pool.release(large)
+    pool.release(small)
+    assert _base(pool.acquire(50)) is _base(small)
+    assert _base(pool.acquire(5000)) is _base(large)
+    # 没有能容纳的缓冲区时新分配
+    assert pool.acquire(20000).shape == (20000,)
+
+
+def test_pool_evicts_smallest_when_full():
+    pool = AudioBufferPool(max_buffers=2)
+    buffers = [pool.acquire(size) for size in (300, 100, 200)]
+    for buf in buffers:
+        pool.release(buf)
+    kept = {id(_base(pool.acquire(1))) for _ in range(2)}
+    assert kept == {id(_base(buffers[0])), id(_base(buffers[2]))}
+
+
+def test_pool_ignores_oversized_foreign_and_duplicate_buffers():
+    pool = AudioBufferPool(max_buffers=4, max_samples=1000)
+    pool.release(np.empty(2000, dtype=np.float32))
+    pool.release(np.empty(500, dtype=np.float64))
+    buf = pool.acquire(500)
+    pool.release(buf)
+    pool.release(buf)
+    assert _base(pool.acquire(500)) is _base(buf)
+    assert _base(pool.acquire(500)) is not _base(buf)
+
+
+def test_pool_feeds_conversions(tmp_path):
+    pool = AudioBufferPool()
+    pcm = _pcm(FRAME_SIZE)
+    first = pcm16_to_float32(pcm, pool)
+    pool.release(first)
+    path = _write_wav(tmp_path / "mono.wav", pcm)
+    second = load_wav_pcm16(str(path), pool)
+    assert _base(second) is _base(first)
+    np.testing.assert_array_equal(second, pcm16_to_float32(pcm))
+
+
+def test_load_wav_pcm16_surfaces_conversion_errors(tmp_path, monkeypatch):
+    def fail(samples, pool=None):
+        raise MemoryError("no buffer")
+
+    monkeypatch.setattr(audio, "pcm16_to_float32", fail)
+    path = _write_wav(tmp_path / "mono.wav", _pcm(FRAME_SIZE))
+    # 转换出错时映射的视图须先释放，关闭映射不能再抛BufferError掩盖原异常
+    with pytest.raises(MemoryError):
+        load_wav_pcm16(str(path))
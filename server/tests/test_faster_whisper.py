@@ -0,0 +1,360 @@
+import asyncio
+import sys
+import threading
+import types
+from dataclasses import dataclass
+
+import numpy as np
+import pytest
+
+import stream_whisper.faster_whisper as fw
+
+
+@dataclass
+class FakeSegment:
+    start: float
+    end: float
+    text: str
+
+
+class FakeWhisperModel:
+    """
+    记录每次transcribe收到的音频，返回覆盖整段音频的一个片段
+    """
+
+    def __init__(self):
+        self.model = types.SimpleNamespace(device="cpu", num_workers=1)
+        self.calls = []
+
+    def transcribe(self, audio, **kwargs):
+        self.calls.append((np.array(audio), kwargs))
+        segment = FakeSegment(0.0, audio.shape[0] / 16000, f"{audio[-1]:g}")
+        return iter([segment]), types.SimpleNamespace(language="zh", language_probability=1.0)
+
+
+class FakePipeline:
+    """
+    BatchedInferencePipeline替身：每个clip返回两个片段，第一个从clip起点开始，第二个的结束时间故意越过clip末尾；
+    与真实流水线一样，时间保留3位小数
+    """
+
+    calls = []
+
+    def __init__(self, model):
+        self.model = model
+
+    def transcribe(self, audio, clip_timestamps, batch_size, **kwargs):
+        FakePipeline.calls.append((clip_timestamps, batch_size, kwargs))
+        segments = []
+        for clip in clip_timestamps:
+            start, end = clip["start"] / 16000, clip["end"] / 16000
+            label = f"{audio[clip['start']]:g}"
+            segments.append(FakeSegment(round(start, 3), round(start + 0.5, 3), f"{label}a"))
+            segments.append(FakeSegment(round(start + 0.6, 3), round(end + 0.3, 3), f"{label}b"))
+        return iter(segments), None
+
+
+@pytest.fixture
+def fake_backend(monkeypatch):
+    """
+    用替身替换faster-whisper与CTranslate2，只在测试内生效
+    """
+    faster_whisper = types.ModuleType("faster_whisper")
+    faster_whisper.BatchedInferencePipeline = FakePipeline
+    vad = types.ModuleType("faster_whisper.vad")
+    vad.VadOptions = lambda **kwargs: kwargs
+    vad.get_vad_model = lambda: None
+    # 替身VAD：全零的音频视为没有语音，其余整段都是语音
+    vad.get_speech_timestamps = lambda audio, options: [] if not audio.any() else [{"start": 0, "end": audio.shape[0]}]
+    ctranslate2 = types.ModuleType("ctranslate2")
+    ctranslate2.get_cuda_device_count = lambda: 0
+    ctranslate2.get_supported_compute_types = lambda device: {"int8", "float32"}
+    monkeypatch.setitem(sys.modules, "faster_whisper", faster_whisper)
+    monkeypatch.setitem(sys.modules, "faster_whisper.vad", vad)
+    monkeypatch.setitem(sys.modules, "ctranslate2", ctranslate2)
+
+    model = FakeWhisperModel()
+    monkeypatch.setattr(fw, "load_whisper_model", lambda *args: model)
+    monkeypatch.setenv("BATCHED_INFERENCE", "false")
+    monkeypatch.setenv("STREAM_SILENCE_RMS", "0")
+    monkeypatch.setenv("STREAM_PARALLELISM", "1")
+    monkeypatch.setattr(FakePipeline, "calls", [])
+    return model
+
+
+def _stream(**kwargs):
+    return fw.FasterWhisperStream(device="cpu", compute_type="int8", vad_filter=False, **kwargs)
+
+
+def _received_audio(model, overlap):
+    """
+    去掉相邻窗口的重叠部分，还原模型实际收到的连续音频
+    """
+    parts = []
+    previous = 0
+    for audio, _ in model.calls:
+        parts.append(audio[min(overlap, previous):])
+        previous = audio.shape[0]
+    return np.concatenate(parts) if parts else np.zeros(0, dtype=np.float32)
+
+
+def test_stream_consumes_audio_queued_before_start(fake_backend):
+    async def run():
+        stream = _stream(language="zh")
+        chunk = np.full(4096, 0.25, dtype=np.float32)
+        for _ in range(3):
+            stream.add_audio_chunk(chunk)
+        stream.start_processing()
+        return await stream.finalize()
+
+    segments = asyncio.run(run())
+    assert len(fake_backend.calls) == 1
+    np.testing.assert_array_equal(fake_backend.calls[0][0], np.full(3 * 4096, 0.25, dtype=np.float32))
+    assert [segment.text for segment in segments] == ["0.25"]
+
+
+def test_stream_windows_cover_input_once(fake_backend, monkeypatch):
+    monkeypatch.setenv("STREAM_WINDOW_SECONDS", "1")
+    monkeypatch.setenv("STREAM_OVERLAP_SECONDS", "0.25")
+    audio = np.arange(1, 16000 * 3 + 1234, dtype=np.float32) / 100000
+
+    async def run():
+        stream = _stream(language="zh")
+        stream.start_processing()
+        for start in range(0, audio.shape[0], 3000):
+            stream.add_audio_chunk(audio[start:start + 3000])
+            # 交替让出事件循环，模拟音频陆续到达
+            await asyncio.sleep(0)
+        return await stream.finalize()
+
+    segments = asyncio.run(run())
+    windows = [call[0].shape[0] for call in fake_backend.calls]
+    # 除最后一个外，每个窗口都至少stream_window秒
+    assert all(length >= 16000 for length in windows[:-1])
+    np.testing.assert_array_equal(_received_audio(fake_backend, 4000), audio)
+    # 片段时间按窗口起点换算，依次递增
+    assert [segment.start for segment in segments] == sorted(segment.start for segment in segments)
+
+
+def test_stream_without_audio_does_not_call_model(fake_backend):
+    async def run():
+        stream = _stream(language="zh")
+        stream.start_processing()
+        return await stream.finalize()
+
+    assert asyncio.run(run()) == []
+    assert fake_backend.calls == []
+
+
+def _window_kwargs(**overrides):
+    return dict(dict(language="zh", beam_size=1, vad_filter=False, vad_parameters={}), **overrides)
+
+
+def test_batcher_maps_segments_back_to_windows(fake_backend):
+    windows = [np.full(16000 * seconds, value, dtype=np.float32) for seconds, value in ((1, 1.0), (2, 2.0), (3, 3.0))]
+
+    async def run():
+        batcher = fw.StreamBatcher(fake_backend, max_batch_size=8, max_wait=0.01)
+        return await asyncio.gather(*(batcher.transcribe(audio, _window_kwargs()) for audio in windows))
+
+    results = asyncio.run(run())
+    assert len(FakePipeline.calls) == 1
+    clips, batch_size, _ = FakePipeline.calls[0]
+    assert batch_size == 3
+    assert clips == [{"start": 0, "end": 16000}, {"start": 16000, "end": 48000}, {"start": 48000, "end": 96000}]
+    for (seconds, value), result in zip(((1, 1), (2, 2), (3, 3)), results):
+        # 时间相对于各自窗口的起点，越过窗口末尾的结束时间被截断
+        assert result == [
+            pytest.approx((0.0, 0.5, f"{value}a")),
+            pytest.approx((0.6, seconds, f"{value}b")),
+        ]
+
+
+def test_batcher_maps_clips_not_aligned_to_milliseconds(fake_backend):
+    # 第二个clip从5.0000625秒开始，取整后片段起点5.0落在clip起点之前
+    first = np.full(80001, 1.0, dtype=np.float32)
+    second = np.full(16000, 2.0, dtype=np.float32)
+
+    async def run():
+        batcher = fw.StreamBatcher(fake_backend, max_batch_size=8, max_wait=0.01)
+        kwargs = _window_kwargs()
+        return await asyncio.gather(batcher.transcribe(first, kwargs), batcher.transcribe(second, kwargs))
+
+    first_result, second_result = asyncio.run(run())
+    assert [text for _, _, text in first_result] == ["1a", "1b"]
+    assert [text for _, _, text in second_result] == ["2a", "2b"]
+    assert second_result[0][0] == 0.0
+
+
+def test_batcher_skips_windows_without_speech(fake_backend):
+    speech = np.full(16000, 0.5, dtype=np.float32)
+    silence = np.zeros(16000, dtype=np.float32)
+
+    async def run():
+        batcher = fw.StreamBatcher(fake_backend, max_batch_size=8, max_wait=0.01)
+        kwargs = _window_kwargs(vad_filter=True)
+        return await asyncio.gather(batcher.transcribe(silence, kwargs), batcher.transcribe(speech, kwargs))
+
+    silent_result, speech_result = asyncio.run(run())
+    assert silent_result == []
+    assert [text for _, _, text in speech_result] == ["0.5a", "0.5b"]
+    assert FakePipeline.calls[0][0] == [{"start": 16000, "end": 32000}]
+
+
+def test_batcher_groups_by_decoding_options(fake_backend):
+    audio = np.ones(16000, dtype=np.float32)
+
+    async def run():
+        batcher = fw.StreamBatcher(fake_backend, max_batch_size=8, max_wait=0.01)
+        await asyncio.gather(
+            batcher.transcribe(audio, _window_kwargs()),
+            batcher.transcribe(audio, _window_kwargs(language="en")),
+            batcher.transcribe(audio, _window_kwargs(beam_size=5)),
+            batcher.transcribe(audio, _window_kwargs()),
+        )
+
+    asyncio.run(run())
+    batches = sorted((len(clips), kwargs["language"], kwargs["beam_size"]) for clips, _, kwargs in FakePipeline.calls)
+    assert batches == [(1, "en", 1), (1, "zh", 5), (2, "zh", 1)]
+
+
+def test_batcher_flushes_full_batch_without_waiting(fake_backend):
+    audio = np.ones(1600, dtype=np.float32)
+
+    async def run():
+        batcher = fw.StreamBatcher(fake_backend, max_batch_size=2, max_wait=60)
+        await asyncio.wait_for(
+            asyncio.gather(batcher.transcribe(audio, _window_kwargs()), batcher.transcribe(audio, _window_kwargs())),
+            timeout=5,
+        )
+
+    asyncio.run(run())
+    assert len(FakePipeline.calls) == 1
+
+
+def test_batcher_propagates_errors(fake_backend, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("decode failed")
+
+    monkeypatch.setattr(FakePipeline, "transcribe", fail)
+    audio = np.ones(1600, dtype=np.float32)
+
+    async def run():
+        batcher = fw.StreamBatcher(fake_backend, max_batch_size=8, max_wait=0.01)
+        return await asyncio.gather(
+            batcher.transcribe(audio, _window_kwargs()), batcher.transcribe(audio, _window_kwargs()),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(run())
+    assert [str(result) for result in results] == ["decode failed", "decode failed"]
+
+
+def test_batcher_maps_vad_trimmed_stream_windows(fake_backend, monkeypatch):
+    # 第二个窗口的VAD结果去掉开头5个采样点，clip从1.0003125秒开始，不在整毫秒上
+    monkeypatch.setattr(sys.modules["faster_whisper.vad"], "get_speech_timestamps",
+                        lambda audio, options: [{"start": 5 if audio[0] == 2.0 else 0, "end": audio.shape[0]}])
+    windows = [np.full(16000, value, dtype=np.float32) for value in (1.0, 2.0)]
+
+    async def run():
+        batcher = fw.StreamBatcher(fake_backend, max_batch_size=8, max_wait=0.01)
+        kwargs = _window_kwargs(vad_filter=True)
+        return await asyncio.gather(*(batcher.transcribe(audio, kwargs) for audio in windows))
+
+    first_result, second_result = asyncio.run(run())
+    assert FakePipeline.calls[0][0] == [{"start": 0, "end": 16000}, {"start": 16005, "end": 32000}]
+    assert [text for _, _, text in first_result] == ["1a", "1b"]
+    assert [text for _, _, text in second_result] == ["2a", "2b"]
+
+
+def test_stream_transcribes_long_window_without_batcher(fake_backend, monkeypatch):
+    monkeypatch.setenv("BATCHED_INFERENCE", "true")
+    monkeypatch.setenv("STREAM_BATCH_SIZE", "8")
+    monkeypatch.setattr(fw, "_STREAM_BATCHERS", {})
+
+    async def run():
+        stream = _stream(language="zh")
+        assert stream._batcher is not None
+        # 超过30秒的窗口若进入批次会被截断，须单独转录
+        long_segments = await stream._transcribe_audio(np.full(16000 * 31, 0.5, dtype=np.float32), 10.0)
+        short_segments = await stream._transcribe_audio(np.full(16000, 0.5, dtype=np.float32), 10.0)
+        return long_segments, short_segments
+
+    long_segments, short_segments = asyncio.run(run())
+    assert len(fake_backend.calls) == 1 and fake_backend.calls[0][0].shape == (16000 * 31,)
+    assert [(segment.start, segment.end) for segment in long_segments] == [(10.0, 41.0)]
+    assert len(FakePipeline.calls) == 1
+    assert [segment.text for segment in short_segments] == ["0.5a", "0.5b"]
+
+
+def test_batcher_file_batches_hold_transcription_slot(fake_backend, monkeypatch):
+    audio = np.ones(1600, dtype=np.float32)
+
+    async def run():
+        semaphore = asyncio.Semaphore(1)
+        monkeypatch.setattr(fw, "_TRANSCRIBE_SEMAPHORE", semaphore)
+        batcher = fw.StreamBatcher(fake_backend, max_batch_size=8, max_wait=0.01)
+        async with semaphore:
+            # 名额被占用时，合并的文件批次等待，流式窗口照常推理
+            files = asyncio.gather(*(batcher.transcribe(audio, _window_kwargs(task="transcribe")) for _ in range(2)))
+            await asyncio.wait_for(batcher.transcribe(audio, _window_kwargs()), timeout=5)
+            await asyncio.sleep(0.05)
+            assert not files.done()
+            assert len(FakePipeline.calls) == 1
+        await asyncio.wait_for(files, timeout=5)
+
+    asyncio.run(run())
+    assert [len(clips) for clips, _, _ in FakePipeline.calls] == [1, 2]
+
+
+def test_transcribe_semaphore_reads_limit_on_first_use(monkeypatch):
+    monkeypatch.setattr(fw, "_TRANSCRIBE_SEMAPHORE", None)
+    # 模块导入之后才设置的环境变量（如入口脚本加载的.env）也能生效
+    monkeypatch.setenv("MAX_CONCURRENT_TRANSCRIPTIONS", "3")
+    semaphore = fw._transcribe_semaphore()
+    assert semaphore._value == 3
+    assert fw._transcribe_semaphore() is semaphore
+
+
+def test_stream_batcher_shared_per_model_and_dropped_on_unload(fake_backend, monkeypatch):
+    key = ("base", "cpu", "int8")
+    monkeypatch.setitem(fw._MODEL_CACHE, key, fake_backend)
+    first = fw.get_stream_batcher(key, fake_backend, 8, 0.05)
+    assert fw.get_stream_batcher(key, fake_backend, 8, 0.05) is first
+    fw.unload_whisper_model(fake_backend)
+    assert key not in fw._STREAM_BATCHERS
+
+
+def test_add_audio_chunk_from_another_thread(fake_backend, monkeypatch):
+    monkeypatch.setenv("STREAM_WINDOW_SECONDS", "1")
+    monkeypatch.setenv("STREAM_OVERLAP_SECONDS", "0")
+    chunks = [np.full(4000, (i + 1) / 100, dtype=np.float32) for i in range(20)]
+
+    async def run():
+        stream = _stream(language="zh")
+        stream.start_processing()
+        producer = threading.Thread(target=lambda: [stream.add_audio_chunk(chunk) for chunk in chunks])
+        producer.start()
+        await asyncio.to_thread(producer.join)
+        # 其他线程提交的音频块经call_soon_threadsafe入队，先让事件循环处理完这些回调
+        await asyncio.sleep(0)
+        await stream.finalize()
+
+    asyncio.run(run())
+    np.testing.assert_array_equal(_received_audio(fake_backend, 0), np.concatenate(chunks))
+
+
+def test_aadd_audio_chunk_normalizes_int16_and_downmixes(fake_backend):
+    async def run():
+        stream = _stream(language="zh")
+        stream.start_processing()
+        await stream.aadd_audio_chunk(np.array([16384, -16384, 32767], dtype=np.int16))
+        await stream.aadd_audio_chunk(np.array([[0.5, 0.25], [-1.0, 0.0]], dtype=np.float32))
+        stream.add_audio_chunk(np.array([[8192, 8192]], dtype=np.int16))
+        await stream.finalize()
+
+    asyncio.run(run())
+    np.testing.assert_array_equal(
+        fake_backend.calls[0][0],
+        np.array([0.5, -0.5, 32767 / 32768, 0.375, -0.5, 0.25], dtype=np.float32),
+    )
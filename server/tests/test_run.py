@@ -0,0 +1,59 @@
+import os
+from unittest import mock
+
+import pytest
+
+# run.py在导入时加载.env，并从stream_whisper读取默认设备
+pytest.importorskip("dotenv")
+pytest.importorskip("uvicorn")
+
+from run import worker_count
+
+
+@pytest.fixture
+def clean_env(monkeypatch):
+    monkeypatch.delenv("DEVICE", raising=False)
+    monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+    monkeypatch.setattr("os.cpu_count", lambda: 32)
+    return monkeypatch
+
+
+def test_worker_count_defaults_to_one_on_gpu(clean_env):
+    # 未设置DEVICE时默认cuda，每个进程各加载一份模型，不能按核数起进程
+    assert worker_count() == 1
+    clean_env.setenv("DEVICE", "cuda")
+    assert worker_count() == 1
+
+
+def test_worker_count_uses_cpu_count_for_cpu_inference(clean_env):
+    clean_env.setenv("DEVICE", "cpu")
+    assert worker_count() == 32
+
+
+def test_worker_count_respects_web_concurrency(clean_env):
+    clean_env.setenv("WEB_CONCURRENCY", "3")
+    assert worker_count() == 3
+    clean_env.setenv("DEVICE", "cpu")
+    assert worker_count() == 3
+
+
+def test_worker_count_single_process_on_reload(clean_env):
+    clean_env.setenv("DEVICE", "cpu")
+    clean_env.setenv("WEB_CONCURRENCY", "8")
+    assert worker_count(reload=True) == 1
+
+
+def test_main_exports_worker_settings(clean_env):
+    import run
+
+    calls = []
+    clean_env.setattr(run.uvicorn, "run", lambda *args, **kwargs: calls.append(kwargs))
+    # main()直接改写os.environ，测试结束后整体还原
+    with mock.patch.dict(os.environ, {"DEVICE": "cpu", "WEB_CONCURRENCY": "4"}):
+        os.environ.pop("RELOAD", None)
+        os.environ.pop("OMP_NUM_THREADS", None)
+        run.main()
+        assert calls[0]["workers"] == 4
+        # 工作进程按导出的进程数划分CPU线程
+        assert os.environ["WEB_CONCURRENCY"] == "4"
+        assert os.environ["OMP_NUM_THREADS"] == "8"